@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Synthetic tweets corpus generator
+
+Writes a twarc-like .jsonl collection. The same arguments and seed always
+generate the same file.
+"""
+
+import argparse
+import datetime
+import json
+import random
+
+WORDS = (
+    "the of and to in is you that it he was for on are as with his they at be "
+    "this have from or one had by word but not what all were we when your can "
+    "said there use an each which she do how their if will up other about out "
+    "many then them these so some her would make like him into time has look "
+    "two more write go see number no way could people my than first water been "
+    "call who oil its now find long down day did get come made may part café "
+    "déjà über naïve"
+).split()
+
+EMOJIS = [
+    "\U0001F600",
+    "\U0001F602",
+    "❤️",
+    "\U0001F44D",
+    "\U0001F525",
+    "\U0001F1EB\U0001F1F7",
+    "\U0001F468‍\U0001F469‍\U0001F467",
+    "☀️",
+    "\U0001F30D",
+    "#️⃣",
+]
+
+PLACE_TYPES = ["city", "admin", "neighborhood", "poi", "country"]
+COUNTRIES = [
+    ("US", "United States"),
+    ("FR", "France"),
+    ("JP", "Japan"),
+    ("BR", "Brazil"),
+]
+
+TWITTER_DATE_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+START_DATE = datetime.datetime(2019, 1, 1)
+
+
+def make_users(rng, count):
+    return [
+        {
+            "id": 1000 + i,
+            "id_str": str(1000 + i),
+            "screen_name": f"user{i}",
+            "name": f"User {i}",
+            "verified": rng.random() < 0.05,
+            "profile_image_url_https": f"https://pbs.twimg.com/profile_images/{i}/avatar_normal.jpg",
+        }
+        for i in range(count)
+    ]
+
+
+def make_places(rng, count):
+    places = []
+    for i in range(count):
+        lon = rng.uniform(-170, 170)
+        lat = rng.uniform(-60, 70)
+        size = rng.choice([0.01, 0.1, 1, 5])
+        country_code, country = rng.choice(COUNTRIES)
+        places.append(
+            {
+                "id": "%016x" % rng.getrandbits(64),
+                "url": "https://api.twitter.com/1.1/geo/id/place.json",
+                "place_type": rng.choice(PLACE_TYPES),
+                "name": f"Place {i}",
+                "full_name": f"Place {i}, {country_code}",
+                "country_code": country_code,
+                "country": country,
+                "contained_within": [],
+                "bounding_box": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [
+                            [lon, lat],
+                            [lon + size, lat],
+                            [lon + size, lat + size],
+                            [lon, lat + size],
+                        ]
+                    ],
+                },
+                "attributes": {},
+            }
+        )
+    return places
+
+
+def make_text(rng, users, emoji_density, tweet_id):
+    """Build a tweet text and its entities, with exact offsets."""
+    parts = []
+    entities = {"hashtags": [], "user_mentions": [], "urls": [], "symbols": []}
+    length = 0
+
+    def add(token, entity_kind=None, entity=None, width=None):
+        nonlocal length
+        if parts:
+            parts.append(" ")
+            length += 1
+        if entity_kind:
+            entity["indices"] = [length, length + len(token)]
+            entities[entity_kind].append(entity)
+        parts.append(token)
+        length += len(token) if width is None else width
+
+    for _ in range(rng.randint(5, 25)):
+        roll = rng.random()
+        if roll < emoji_density:
+            add(rng.choice(EMOJIS))
+        elif roll < emoji_density + 0.05:
+            tag = rng.choice(WORDS) + str(rng.randint(0, 99))
+            add("#" + tag, "hashtags", {"text": tag})
+        elif roll < emoji_density + 0.08:
+            user = rng.choice(users)
+            add(
+                "@" + user["screen_name"],
+                "user_mentions",
+                {
+                    "screen_name": user["screen_name"],
+                    "name": user["name"],
+                    "id": user["id"],
+                    "id_str": user["id_str"],
+                },
+            )
+        elif roll < emoji_density + 0.1:
+            # Escaped like in API payloads, offsets count it as one character
+            add("&amp;", width=1)
+        else:
+            add(rng.choice(WORDS))
+
+    if rng.random() < 0.3:
+        url = f"https://t.co/{tweet_id % 10 ** 10:010d}"
+        add(
+            url,
+            "urls",
+            {
+                "url": url,
+                "expanded_url": f"https://example.com/article/{tweet_id}",
+                "display_url": f"example.com/article/{tweet_id}"[:26] + "…",
+            },
+        )
+
+    return "".join(parts), entities, length
+
+
+def make_tweet(rng, n, users, places, args):
+    tweet_id = 1100000000000000000 + n * 1000 + rng.randint(0, 999)
+    user = users[n % len(users)] if rng.random() < 0.5 else rng.choice(users)
+    text, entities, length = make_text(rng, users, args.emoji_density, tweet_id)
+    created_at = START_DATE + datetime.timedelta(seconds=n * 37)
+
+    tweet = {
+        "created_at": created_at.strftime(TWITTER_DATE_FORMAT),
+        "id": tweet_id,
+        "id_str": str(tweet_id),
+        "full_text": text,
+        "truncated": False,
+        "display_text_range": [0, length],
+        "entities": entities,
+        "source": '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>',
+        "user": user,
+        "geo": None,
+        "coordinates": None,
+        "place": None,
+        "retweet_count": rng.randint(0, 100),
+        "favorite_count": int(rng.paretovariate(1.2)) - 1,
+        "lang": "en",
+    }
+
+    if rng.random() < args.geo_ratio:
+        place = rng.choice(places)
+        tweet["place"] = place
+        if rng.random() < args.coordinates_ratio:
+            (lon0, lat0), _, (lon1, lat1), _ = place["bounding_box"]["coordinates"][0]
+            lon, lat = rng.uniform(lon0, lon1), rng.uniform(lat0, lat1)
+            tweet["coordinates"] = {"type": "Point", "coordinates": [lon, lat]}
+            tweet["geo"] = {"type": "Point", "coordinates": [lat, lon]}
+
+    if rng.random() < args.media_ratio:
+        media_url = f"https://t.co/m{tweet_id % 10 ** 9:09d}"
+        start = length + 1
+        tweet["full_text"] = text + " " + media_url
+        media = [
+            {
+                "id": tweet_id + i,
+                "media_url_https": f"https://pbs.twimg.com/media/{tweet_id}_{i}.jpg",
+                "url": media_url,
+                "display_url": "pic.twitter.com/abcdef",
+                "expanded_url": f"https://twitter.com/{user['screen_name']}/status/{tweet_id}/photo/1",
+                "type": rng.choice(["photo", "photo", "video"]),
+                "indices": [start, start + len(media_url)],
+            }
+            for i in range(rng.randint(1, 4))
+        ]
+        tweet["entities"]["media"] = media[:1]
+        tweet["extended_entities"] = {"media": media}
+
+    return tweet
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    users = make_users(rng, args.authors)
+    places = make_places(rng, args.places)
+    with open(args.output, "w", encoding="utf-8") as output:
+        for n in range(args.size):
+            tweet = make_tweet(rng, n, users, places, args)
+            output.write(json.dumps(tweet, ensure_ascii=False) + "\n")
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic .jsonl collection of tweets."
+    )
+    parser.add_argument("-o", "--output", required=True, help="Output .jsonl file")
+    parser.add_argument(
+        "-n", "--size", type=int, default=10000, help="Number of tweets"
+    )
+    parser.add_argument(
+        "--geo-ratio",
+        type=float,
+        default=0.25,
+        help="Share of tweets with a place (default = 0.25)",
+    )
+    parser.add_argument(
+        "--coordinates-ratio",
+        type=float,
+        default=0.4,
+        help="Share of geo tweets with exact coordinates (default = 0.4)",
+    )
+    parser.add_argument(
+        "--places",
+        type=int,
+        default=500,
+        help="Number of distinct places, reused across tweets (default = 500)",
+    )
+    parser.add_argument(
+        "--emoji-density",
+        type=float,
+        default=0.05,
+        help="Probability for each token of the text to be an emoji "
+        "(default = 0.05)",
+    )
+    parser.add_argument(
+        "--media-ratio",
+        type=float,
+        default=0.1,
+        help="Share of tweets with media (default = 0.1)",
+    )
+    parser.add_argument(
+        "--authors", type=int, default=1000, help="Number of authors (default = 1000)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser
+
+
+if __name__ == "__main__":
+    generate(parser().parse_args())
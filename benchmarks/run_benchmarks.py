@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Per-stage benchmarks
+
+Each stage runs in its own process on a synthetic corpus (see
+generate_corpus.py), and reports its throughput, the current RSS of the
+process before and after the stage, and the peak RSS of the process since
+it started (the corpus setup included). Nothing is fetched from the
+network.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+STAGES = [
+    "read_jsonl",
+    "is_geo",
+    "format_tweet_emojis",
+    "tweet_to_html",
+    "add_tweets",
+    "save",
+]
+SIZES = [10000, 100000, 1000000]
+
+
+def read_records(corpus):
+    """Parse every tweet of the corpus, geo or not."""
+    from tweetsmapper.utils.models import GeoTweet
+
+    users, places = {}, {}
+    with open(corpus, encoding="utf-8") as corpus_file:
+        return [
+            GeoTweet.from_json(json.loads(line), users, places) for line in corpus_file
+        ]
+
+
+def read_geo_tweets(corpus):
+    from tweetsmapper.utils import import_file
+
+    return list(import_file.read_jsonl([corpus]))
+
+
+def build_map(geo_tweets):
+    from tweetsmapper.utils import map
+
+    tweets_map = map.create()
+    tweets_cluster = map.add_cluster(tweets_map)
+    map.add_tweets(geo_tweets, tweets_cluster, tweets_map)
+    return tweets_map
+
+
+def prepare_stage(stage, corpus):
+    """Set up a stage, returning the number of items it processes and the
+    function doing the work, to be measured. Marker popups are rendered
+    when the map is written, so they count in save rather than add_tweets."""
+    from tweetsmapper.utils import display, import_file, map, results
+
+    if stage == "read_jsonl":
+        with open(corpus, "rb") as corpus_file:
+            items = sum(1 for _ in corpus_file)
+
+        def work():
+            list(import_file.read_jsonl([corpus]))
+
+        return items, work
+
+    if stage == "is_geo":
+        tweets = read_records(corpus)
+
+        def work():
+            for tweet in tweets:
+                results.is_geo(tweet)
+
+        return len(tweets), work
+
+    if stage == "format_tweet_emojis":
+        texts = [tweet.full_text for tweet in read_records(corpus)]
+        display.emoji_regex()
+
+        def work():
+            for text in texts:
+                display.format_tweet_emojis(text)
+
+        return len(texts), work
+
+    geo_tweets = read_geo_tweets(corpus)
+
+    if stage == "tweet_to_html":
+        popup_template = display.get_template("popup.html.j2")
+
+        def work():
+            for tweet in geo_tweets:
+                display.tweet_to_html(tweet, popup_template)
+
+        return len(geo_tweets), work
+
+    if stage == "add_tweets":
+        return len(geo_tweets), lambda: build_map(geo_tweets)
+
+    if stage == "save":
+        tweets_map = build_map(geo_tweets)
+
+        def work():
+            with tempfile.TemporaryDirectory() as output_dir:
+                map.write_map(tweets_map, os.path.join(output_dir, "map.html"))
+
+        return len(geo_tweets), work
+
+    raise ValueError(f"Unknown stage {stage}")
+
+
+def run_stage(stage, corpus):
+    """Run a stage and return its report. Memory is the current RSS of the
+    process before and after the work, setup excluded (Linux only), and its
+    peak RSS since it started, setup included."""
+    from tweetsmapper.utils import report
+
+    items, work = prepare_stage(stage, corpus)
+    rss_before_mb = report.rss_mb()
+    start = time.perf_counter()
+    work()
+    seconds = time.perf_counter() - start
+    return {
+        "stage": stage,
+        "items": items,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(items / seconds) if seconds else None,
+        "rss_before_mb": rss_before_mb,
+        "rss_after_mb": report.rss_mb(),
+        "lifetime_peak_rss_mb": report.cumulative_peak_rss_mb(),
+    }
+
+
+def stage_process(stage, corpus):
+    """Run a stage in a new process, and return its report."""
+    output = subprocess.run(
+        [sys.executable, __file__, "--stage", stage, "--corpus", corpus],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def corpus_path(corpus_dir, size, seed):
+    """Return the path of a corpus, generating it if needed."""
+    path = os.path.join(corpus_dir, f"corpus-{size}-{seed}.jsonl")
+    if not os.path.exists(path):
+        print(f"Generating {size} tweets corpus...", file=sys.stderr)
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(BENCHMARKS_DIR, "generate_corpus.py"),
+                "-o",
+                path,
+                "-n",
+                str(size),
+                "--seed",
+                str(seed),
+            ],
+            check=True,
+        )
+    return path
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the stages of tweetsmapper on synthetic corpora."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=SIZES,
+        help="Corpus sizes, in tweets (default = 10000 100000 1000000)",
+    )
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run"
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        default=os.path.join(tempfile.gettempdir(), "tweetsmapper-benchmarks"),
+        help="Directory where generated corpora are kept between runs",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed")
+    parser.add_argument("--json", help="Also write the reports to a JSON file")
+    # Internal: run a single stage in this process
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = parser().parse_args()
+
+    if args.stage:
+        print(json.dumps(run_stage(args.stage, args.corpus)))
+        return
+
+    os.makedirs(args.corpus_dir, exist_ok=True)
+    reports = []
+    print(
+        "{:>8} {:<20} {:>8} {:>8} {:>10} {:>11} {:>11} {:>14}".format(
+            "size",
+            "stage",
+            "items",
+            "seconds",
+            "items/s",
+            "RSS before",
+            "RSS after",
+            "lifetime peak",
+        )
+    )
+    for size in args.sizes:
+        corpus = corpus_path(args.corpus_dir, size, args.seed)
+        for stage in args.stages:
+            report = dict(stage_process(stage, corpus), size=size)
+            reports.append(report)
+            print(
+                "{size:>8} {stage:<20} {items:>8} {seconds:>8} "
+                "{items_per_second:>10} {rss_before_mb:>8} MB {rss_after_mb:>8} MB "
+                "{lifetime_peak_rss_mb:>11} MB".format(**report),
+                flush=True,
+            )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(reports, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
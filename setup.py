@@ -17,6 +17,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import re
 from os import path
 from setuptools import setup, find_packages
 
@@ -26,8 +27,13 @@ here = path.abspath(path.dirname(__file__))
 with open(path.join(here, "README.md"), encoding="utf-8") as f:
     long_description = f.read()
 
+# Get the version without importing the package and its dependencies
+with open(path.join(here, "tweetsmapper", "__init__.py"), encoding="utf-8") as f:
+    version = re.search(r'^__version__ = "(.*)"', f.read(), re.M).group(1)
+
 requirements = [
     "folium",
+    "numpy",
     "tweepy",
     "twint @ git+https://github.com/twintproject/twint.git@master#egg=twint",
     "tqdm",
@@ -37,15 +43,16 @@ requirements = [
 
 setup(
     name="tweetsmapper",
-    version="1.0",
+    version=version,
     description="Generate Leaflet maps from geo-enabled tweets.",
     long_description_content_type="text/markdown",
     url="https://github.com/r3mlab/tweetsmapper",
     author="r3mlab",
     author_email="remlab@protonmail.com",
     packages=find_packages(exclude=["docs"]),
-    python_requires=">=3.5",
+    python_requires=">=3.6",
     install_requires=requirements,
+    extras_require={"zstd": ["zstandard"]},
     license="GPLv3",
     entry_points={"console_scripts": ["tweetsmapper=tweetsmapper:main"]},
     zip_safe=False,
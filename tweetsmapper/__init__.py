@@ -19,7 +19,8 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from sys import version_info
-from tweetsmapper import run
+
+__version__ = "1.0"
 
 
 def main():
@@ -27,6 +28,8 @@ def main():
     if version_info.major == "2":
         print("You appear to be running Python 2. tweetsmapper requires Python 3.")
     else:
+        from tweetsmapper import run
+
         try:
             run.main()
         except KeyboardInterrupt:
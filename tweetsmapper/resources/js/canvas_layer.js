@@ -0,0 +1,144 @@
+(function(tweetsmapper) {
+
+    var RADIUS = 5;
+    var HIT_RADIUS = 8;
+    var TILE_SIZE = 256;
+    var MAX_LATITUDE = 85.0511287798;
+
+    // Project to Web Mercator pixels at zoom 0, same as Leaflet's EPSG3857
+    function projectPoints(latLons) {
+        var count = latLons.length / 2;
+        var points = new Float64Array(latLons.length);
+        for (var i = 0; i < count; i++) {
+            var lat = Math.max(Math.min(latLons[2 * i], MAX_LATITUDE), -MAX_LATITUDE);
+            var sin = Math.sin(lat * Math.PI / 180);
+            points[2 * i] = TILE_SIZE * (latLons[2 * i + 1] / 360 + 0.5);
+            points[2 * i + 1] = TILE_SIZE * (0.5 - Math.log((1 + sin) / (1 - sin)) / (4 * Math.PI));
+        }
+        return points;
+    }
+
+    // Leaflet layer drawing points on a single canvas, with hit-tested popups
+    var CanvasPoints = L.Layer.extend({
+
+        initialize: function(latLons, indexes, color, onClick) {
+            this._latLons = latLons;
+            this._points = projectPoints(latLons);
+            this._indexes = indexes;
+            this._color = color;
+            this._onClick = onClick;
+        },
+
+        onAdd: function(map) {
+            this._canvas = L.DomUtil.create('canvas', 'leaflet-zoom-hide tweets-canvas');
+            this.getPane().appendChild(this._canvas);
+            map.on('moveend resize', this._redraw, this);
+            map.on('click', this._click, this);
+            this._redraw();
+        },
+
+        onRemove: function(map) {
+            map.off('moveend resize', this._redraw, this);
+            map.off('click', this._click, this);
+            L.DomUtil.remove(this._canvas);
+        },
+
+        // Offset and scale from zoom 0 pixels to canvas pixels
+        _transform: function() {
+            var map = this._map;
+            var topLeft = map.containerPointToLayerPoint([0, 0]);
+            var origin = map.getPixelOrigin().add(topLeft);
+            return {scale: Math.pow(2, map.getZoom()), x: origin.x, y: origin.y, topLeft: topLeft};
+        },
+
+        _redraw: function() {
+            var size = this._map.getSize();
+            var t = this._transform();
+            var canvas = this._canvas;
+            canvas.width = size.x;
+            canvas.height = size.y;
+            L.DomUtil.setPosition(canvas, t.topLeft);
+
+            var ctx = canvas.getContext('2d');
+            ctx.fillStyle = this._color;
+            ctx.strokeStyle = 'white';
+            ctx.beginPath();
+            var points = this._points;
+            for (var i = 0; i < points.length; i += 2) {
+                var x = points[i] * t.scale - t.x;
+                var y = points[i + 1] * t.scale - t.y;
+                if (x < -RADIUS || y < -RADIUS || x > size.x + RADIUS || y > size.y + RADIUS) {
+                    continue;
+                }
+                ctx.moveTo(x + RADIUS, y);
+                ctx.arc(x, y, RADIUS, 0, 2 * Math.PI);
+            }
+            ctx.fill();
+            ctx.stroke();
+        },
+
+        // Open the popup of the points under the cursor, closest first:
+        // tweets at the same location (e.g. of the same place) are all hit
+        _click: function(e) {
+            var t = this._transform();
+            var target = this._map.latLngToContainerPoint(e.latlng);
+            var points = this._points;
+            var hits = [];
+            for (var i = 0; i < points.length; i += 2) {
+                var dx = points[i] * t.scale - t.x - target.x;
+                var dy = points[i + 1] * t.scale - t.y - target.y;
+                var distance = dx * dx + dy * dy;
+                if (distance <= HIT_RADIUS * HIT_RADIUS) {
+                    hits.push({point: i / 2, distance: distance});
+                }
+            }
+            if (!hits.length) {
+                return;
+            }
+            hits.sort(function(a, b) {
+                return a.distance - b.distance || a.point - b.point;
+            });
+            var indexes = this._indexes;
+            var closest = hits[0].point;
+            this._onClick(hits.map(function(hit) {
+                return indexes[hit.point];
+            }), [this._latLons[2 * closest], this._latLons[2 * closest + 1]]);
+        }
+    });
+
+    // Draw tweets as canvas points, split between the two layer groups
+    tweetsmapper.addCanvasTweets = function(data, coordsGroup, placeGroup) {
+        var layers = [
+            {group: coordsGroup, color: '#1DA1F2', latLons: [], indexes: []},
+            {group: placeGroup, color: '#8ED0F9', latLons: [], indexes: []}
+        ];
+        data.tweets.forEach(function(tweet, i) {
+            var layer = layers[tweet[3] ? 0 : 1];
+            layer.latLons.push(tweet[1], tweet[2]);
+            layer.indexes.push(i);
+        });
+
+        // Several tweets under the cursor are shown one at a time
+        var openPopup = function(hits, latLng) {
+            var map = coordsGroup._map || placeGroup._map;
+            var pages = hits.map(function(i) {
+                return tweetsmapper.popup(data, i);
+            });
+            var content = pages.length === 1 ? pages[0] : tweetsmapper.pagedPopup(pages);
+            L.popup({maxWidth: '100%'})
+                .setLatLng(latLng)
+                .setContent(content)
+                .openOn(map);
+        };
+
+        layers.forEach(function(layer) {
+            layer.group.addLayer(new CanvasPoints(
+                new Float64Array(layer.latLons),
+                new Uint32Array(layer.indexes),
+                layer.color,
+                openPopup
+            ));
+        });
+    };
+
+})(tweetsmapper);
@@ -0,0 +1,11 @@
+function(cluster) {
+    // Markers of co-located tweets (--aggregate) count all their tweets
+    var count = cluster.getAllChildMarkers().reduce(function(sum, marker) {
+        return sum + (marker.options.tweetsCount || 1);
+    }, 0);
+    return new L.divIcon({
+        html: '<div><span>' + count + '</span></div>',
+        className: 'marker-cluster marker-cluster-blue',
+        iconSize: new L.Point(40, 40)
+    });
+}
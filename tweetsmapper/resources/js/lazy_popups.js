@@ -0,0 +1,198 @@
+var tweetsmapper = (function() {
+
+    // Data layout must match display.tweets_to_data
+    var TWEET = {ID: 0, LAT: 1, LON: 2, HAS_COORDS: 3, TEXT: 4, DATE: 5, FAVCOUNT: 6, USER: 7, PLACE: 8, MEDIA: 9};
+    var USER = {SCREEN_NAME: 0, NAME: 1, AVATAR: 2, VERIFIED: 3};
+    var PLACE = {ID: 0, FULL_NAME: 1, COUNTRY: 2, COUNTRY_CODE: 3};
+    var MEDIA = {URL: 0, TYPE: 1, TOTAL: 2};
+    var BLOCKED_TABS = '⚠ Your browser may block tabs, check for prompts';
+
+    function escape(text) {
+        return String(text)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
+    }
+
+    function format(link, values) {
+        return link.replace(/\{(\w+)\}/g, function(match, key) {
+            return values[key];
+        });
+    }
+
+    function link(href, content, attrs) {
+        return '<a target="_blank" rel="noreferrer" href="' + escape(href) + '"' + (attrs || '') + '>' + content + '</a>';
+    }
+
+    function servicesList(services, countryCode, values) {
+        var selected = services.filter(function(service) {
+            return service.countries[0] === 'all' || service.countries.indexOf(countryCode) !== -1;
+        });
+        var openAll = selected.map(function(service) {
+            return "window.open('" + format(service.link, values).replace(/'/g, "\\'") + "');";
+        }).join(' ');
+
+        var items = '<li><strong><a href="#" rel="noreferrer" title="' + BLOCKED_TABS + '" onclick="' + escape(openAll) + '">All</a></strong></li>';
+        selected.forEach(function(service) {
+            items += '<li>' + link(
+                format(service.link, values),
+                '<div class="service-logo ' + service.logo_css_class + '"></div>',
+                ' title="' + escape(service.name) + '"'
+            ) + '</li>';
+        });
+
+        return '<div class="location-search"><div class="location-title">Search</div>' +
+            '<div class="services-list"><ul>' + items + '</ul></div></div>';
+    }
+
+    function locationTable(rows) {
+        return '<div class="location-info"><table>' + rows.map(function(row) {
+            return '<tr><td>' + row[0] + '</td><td' + (row[2] ? ' class="location-detail"' : '') + '>' + escape(row[1]) + '</td></tr>';
+        }).join('') + '</table></div>';
+    }
+
+    function placeTab(data, place) {
+        return '<div class="location-container">' +
+            locationTable([
+                ['Place ID:', place[PLACE.ID]],
+                ['Full name:', place[PLACE.FULL_NAME]],
+                ['Country:', place[PLACE.COUNTRY]]
+            ]) +
+            servicesList(data.services.from_place, place[PLACE.COUNTRY_CODE], {
+                search: place[PLACE.FULL_NAME],
+                place_id: place[PLACE.ID]
+            }) +
+            '</div>';
+    }
+
+    function coordinatesTab(data, tweet, place) {
+        return '<div class="location-container">' +
+            locationTable([
+                ['Longitude:', tweet[TWEET.LON], true],
+                ['Latitude:', tweet[TWEET.LAT], true]
+            ]) +
+            servicesList(data.services.from_coordinates, place ? place[PLACE.COUNTRY_CODE] : null, {
+                lat: tweet[TWEET.LAT],
+                lon: tweet[TWEET.LON]
+            }) +
+            '</div>';
+    }
+
+    function tweetTab(tweet, user, place) {
+        var profileUrl = 'https://twitter.com/' + user[USER.SCREEN_NAME];
+        var statusUrl = profileUrl + '/status/' + tweet[TWEET.ID];
+        var media = tweet[TWEET.MEDIA];
+        var html = '<div class="tweet-container"><div>';
+
+        if (media) {
+            var overlays = '';
+            if (media[MEDIA.TOTAL] > 1) {
+                overlays += '<div class="multiple-media-overlay">+ ' + (media[MEDIA.TOTAL] - 1) + ' more media</div>';
+            }
+            if (media[MEDIA.TYPE] === 'video') {
+                overlays += '<div class="tweet-media-overlay"><div class="tweet-icon tweet-icon-play"></div></div>';
+            }
+            html += '<div class="tweet-media" title="View media on Twitter">' +
+                link(statusUrl, overlays + '<img src="' + escape(media[MEDIA.URL]) + '">') + '</div>';
+        }
+
+        html += '<div class="tweet"><div class="tweet-flex tweet-header">' +
+            link(profileUrl, '<img alt="avatar" src="' + escape(user[USER.AVATAR]) + '">') +
+            '<div class="tweet-flex tweet-author">' + link(profileUrl,
+                '<span class="tweet-flex tweet-author-decorated-name">' +
+                '<span class="tweet-author-name">' + escape(user[USER.NAME]) + '</span>' +
+                (user[USER.VERIFIED] ? '<span class="tweet-author-verified"><div class="tweet-icon tweet-icon-verified"></div></span>' : '') +
+                '</span><span class="tweet-author-screenname">@' + user[USER.SCREEN_NAME] + '</span>'
+            ) + '</div>' +
+            '<div class="tweet-brand">' + link(statusUrl, '<div class="tweet-icon tweet-icon-bird" title="View on Twitter"></div>') + '</div>' +
+            '</div>';
+
+        html += '<div class="tweet-body"><p class="tweet-text" lang="en">' + tweet[TWEET.TEXT] + '</p>' +
+            '<div class="tweet-flex tweet-info">' +
+            '<div>' + link(statusUrl, '<div class="tweet-icon tweet-icon-heart"></div><span class="tweet-info-heart-stat">' + tweet[TWEET.FAVCOUNT] + '</span>') + '</div>' +
+            '<div class="tweet-info-timegeo">' + link(statusUrl, '<time>' + tweet[TWEET.DATE] + '</time>');
+        if (place) {
+            html += ' · ' + link('https://twitter.com/search?q=place:' + place[PLACE.ID], escape(place[PLACE.FULL_NAME]), ' title="Explore this place on Twitter"');
+        }
+        html += '</div><div><a class="tweet-icon tweet-icon-notice" target="_blank" rel="noreferrer" href="https://support.twitter.com/articles/20175256" title="Twitter Ads info and privacy"></a></div>' +
+            '</div>';
+        if (tweet[TWEET.HAS_COORDS]) {
+            html += '<div class="tweet-flex tweet-coordinates"><div class="tweet-icon tweet-icon-location"></div>' +
+                '<span>Lon: ' + tweet[TWEET.LON] + '</span> <span>Lat: ' + tweet[TWEET.LAT] + '</span></div>';
+        }
+        return html + '</div></div></div></div>';
+    }
+
+    function tabLink(id, label) {
+        return '<a href="#' + id + '"><li class="tab-link"> <span>' + label + '</span></li></a>';
+    }
+
+    function tab(id, contentClass, content) {
+        return '<div class="tab" id="' + id + '"><div class="' + contentClass + '">' + content + '</div></div>';
+    }
+
+    // Build the HTML of the popup of the i-th tweet, same as popup.html.j2
+    function popup(data, i) {
+        var tweet = data.tweets[i];
+        var user = data.users[tweet[TWEET.USER]];
+        var place = tweet[TWEET.PLACE] === -1 ? null : data.places[tweet[TWEET.PLACE]];
+
+        var links = tabLink('tweet-tab', 'Tweet');
+        var tabs = tab('tweet-tab', 'content', tweetTab(tweet, user, place));
+        if (place) {
+            links += tabLink('place-tab', 'Place');
+            tabs += tab('place-tab', 'content content-location', placeTab(data, place));
+        }
+        if (tweet[TWEET.HAS_COORDS]) {
+            links += tabLink('coordinates-tab', 'Coordinates');
+            tabs += tab('coordinates-tab', 'content content-location', coordinatesTab(data, tweet, place));
+        }
+        return '<div class="tabs"><ul class="tabs-link">' + links + '</ul>' + tabs + '</div>';
+    }
+
+    // Create one marker per tweet, its popup is only built when opened.
+    // With data.cells (lists of tweet indexes, see geo.aggregate), create
+    // one marker per cell instead, at the location of its first tweet, and
+    // show its tweets one at a time (see paged_popups.js).
+    function addTweets(data, coordsGroup, placeGroup, icon) {
+        var cells = data.cells || data.tweets.map(function(tweet, i) {
+            return [i];
+        });
+        cells.forEach(function(cell) {
+            var tweet = data.tweets[cell[0]];
+            var marker = L.marker([tweet[TWEET.LAT], tweet[TWEET.LON]], {icon: icon, tweetsCount: cell.length});
+            marker.bindPopup(function() {
+                if (cell.length === 1) {
+                    return popup(data, cell[0]);
+                }
+                return tweetsmapper.pagedPopup(cell.map(function(i) {
+                    return popup(data, i);
+                }));
+            }, {maxWidth: '100%'});
+            (tweet[TWEET.HAS_COORDS] ? coordsGroup : placeGroup).addLayer(marker);
+        });
+    }
+
+    // Fetch data from a (gzipped) JSON file, then add it with addTweets or
+    // the add function of another render mode, passing it the other arguments
+    function fetchTweets(url, add) {
+        var args = Array.prototype.slice.call(arguments, 2);
+        fetch(url).then(function(response) {
+            var body = response.body;
+            if (/\.gz$/.test(url) && response.headers.get('Content-Encoding') !== 'gzip') {
+                body = body.pipeThrough(new DecompressionStream('gzip'));
+            }
+            return new Response(body).json();
+        }).then(function(data) {
+            add.apply(null, [data].concat(args));
+        });
+    }
+
+    return {
+        popup: popup,
+        addTweets: addTweets,
+        fetchTweets: fetchTweets
+    };
+})();
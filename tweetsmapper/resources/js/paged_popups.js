@@ -0,0 +1,38 @@
+// Popup of the tweets of one location (see --aggregate, the canvas points
+// under the cursor and preclustered tweets at the same location), showing
+// one tweet at a time. Only the current page is in the DOM, so that the
+// tabs of each tweet popup keep their ids.
+var tweetsmapper = tweetsmapper || {};
+
+tweetsmapper.pagedPopup = function(pages) {
+    var container = L.DomUtil.create('div', 'tweets-pages');
+    var nav = L.DomUtil.create('div', 'tweets-pages-nav', container);
+    var previous = L.DomUtil.create('a', 'tweets-pages-previous', nav);
+    var label = L.DomUtil.create('span', 'tweets-pages-label', nav);
+    var next = L.DomUtil.create('a', 'tweets-pages-next', nav);
+    var content = L.DomUtil.create('div', 'tweets-pages-content', container);
+    var current = 0;
+
+    previous.href = next.href = '#';
+    previous.innerHTML = '&lsaquo;';
+    next.innerHTML = '&rsaquo;';
+    previous.title = 'Previous tweet';
+    next.title = 'Next tweet';
+
+    function show(i) {
+        current = (i + pages.length) % pages.length;
+        content.innerHTML = pages[current];
+        label.textContent = (current + 1) + ' / ' + pages.length;
+    }
+
+    L.DomEvent.on(previous, 'click', function(e) {
+        L.DomEvent.preventDefault(e);
+        show(current - 1);
+    });
+    L.DomEvent.on(next, 'click', function(e) {
+        L.DomEvent.preventDefault(e);
+        show(current + 1);
+    });
+    show(0);
+    return container;
+};
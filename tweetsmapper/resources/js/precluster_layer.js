@@ -0,0 +1,113 @@
+(function(tweetsmapper) {
+
+    // Cluster layout must match cluster.hierarchy
+    var CLUSTER = {LAT: 0, LON: 1, COUNT: 2, EXPANSION_ZOOM: 3};
+    var TILE_SIZE = 256;
+
+    // Show the precomputed clusters and single tweets of the current zoom,
+    // only creating markers for those in the tiles in view. Clusters come
+    // from the hierarchy of the visible layers (coordinates / place only),
+    // like MarkerCluster subgroups.
+    tweetsmapper.addPreclusteredTweets = function(data, coordsGroup, placeGroup, icon, createClusterIcon) {
+        var clusters = data.clusters;
+        var layer = L.layerGroup();
+        var visible = {};
+
+        // Marker of a tweet, or of the tweets at the same location (a list
+        // of indexes), shown one at a time
+        function tweetMarker(single) {
+            var indexes = [].concat(single);
+            var tweet = data.tweets[indexes[0]];
+            var marker = L.marker([tweet[1], tweet[2]], {icon: icon});
+            marker.bindPopup(function() {
+                if (indexes.length === 1) {
+                    return tweetsmapper.popup(data, indexes[0]);
+                }
+                return tweetsmapper.pagedPopup(indexes.map(function(i) {
+                    return tweetsmapper.popup(data, i);
+                }));
+            }, {maxWidth: '100%'});
+            return marker;
+        }
+
+        function clusterMarker(map, cluster) {
+            var latLng = L.latLng(cluster[CLUSTER.LAT], cluster[CLUSTER.LON]);
+            var marker = L.marker(latLng, {
+                icon: createClusterIcon({
+                    getChildCount: function() {
+                        return cluster[CLUSTER.COUNT];
+                    }
+                })
+            });
+            marker.on('click', function() {
+                map.setView(latLng, cluster[CLUSTER.EXPANSION_ZOOM]);
+            });
+            return marker;
+        }
+
+        // Call fn with the items of each tile of index in bounds at zoom
+        function forEachTile(map, bounds, zoom, index, fn) {
+            var last = Math.pow(2, zoom) - 1;
+            var min = map.project(bounds.getNorthWest(), zoom).divideBy(TILE_SIZE).floor();
+            var max = map.project(bounds.getSouthEast(), zoom).divideBy(TILE_SIZE).floor();
+            for (var x = Math.max(min.x, 0); x <= Math.min(max.x, last); x++) {
+                for (var y = Math.max(min.y, 0); y <= Math.min(max.y, last); y++) {
+                    var key = x + ',' + y;
+                    if (index[key]) {
+                        fn(index[key], key);
+                    }
+                }
+            }
+        }
+
+        function update() {
+            var map = layer._map;
+            if (!map) {
+                return;
+            }
+            var showCoords = map.hasLayer(coordsGroup);
+            var showPlace = map.hasLayer(placeGroup);
+            var name = showCoords ? (showPlace ? 'all' : 'coordinates') : (showPlace ? 'place' : null);
+            var levels = name ? clusters.layers[name] : [];
+            var zoom = Math.min(Math.max(Math.round(map.getZoom()), clusters.minZoom), clusters.maxZoom + 1);
+            var bounds = map.getBounds().pad(0.2);
+            var wanted = {};
+
+            // Tweets shown on their own from a lower zoom are indexed at it
+            levels.slice(0, zoom - clusters.minZoom + 1).forEach(function(level, k) {
+                forEachTile(map, bounds, clusters.minZoom + k, level.singles, function(singles) {
+                    singles.forEach(function(single) {
+                        wanted['t' + [].concat(single)[0]] = tweetMarker.bind(null, single);
+                    });
+                });
+            });
+            if (levels.length) {
+                forEachTile(map, bounds, zoom, levels[zoom - clusters.minZoom].clusters, function(tileClusters, key) {
+                    tileClusters.forEach(function(cluster, k) {
+                        wanted['c' + name + zoom + '-' + key + '-' + k] = clusterMarker.bind(null, map, cluster);
+                    });
+                });
+            }
+
+            // Keep markers still in view, so that open popups stay open
+            Object.keys(visible).forEach(function(key) {
+                if (!(key in wanted)) {
+                    layer.removeLayer(visible[key]);
+                    delete visible[key];
+                }
+            });
+            Object.keys(wanted).forEach(function(key) {
+                if (!(key in visible)) {
+                    visible[key] = wanted[key]();
+                    layer.addLayer(visible[key]);
+                }
+            });
+        }
+
+        var map = coordsGroup._map || placeGroup._map;
+        layer.addTo(map);
+        map.on('moveend overlayadd overlayremove', update);
+        update();
+    };
+
+})(tweetsmapper);
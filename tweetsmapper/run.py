@@ -19,13 +19,16 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import logging
-import pkg_resources
 import os
 import sys
 import datetime
 import argparse
 
-from .utils import args_check, api, import_file, map, results, scrape
+from tweetsmapper import __version__
+from .utils import args_check, cache, report
+
+# Other modules import heavy dependencies (tweepy, folium, etc.), they are
+# imported when needed so that -h and --configure start fast
 
 
 # logging.basicConfig(level=logging.DEBUG, format='%(levelname)s: %(message)s')
@@ -33,12 +36,22 @@ logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("tweetsmapper")
 
 
-def get_tweets(args):
+def get_tweets(args, run_report=None):
     """Get tweets to consider for mapping."""
+    from .utils import api, import_file, journal, results
+
     geo_tweets = []
+    run_report = run_report or report.RunReport()
 
     input_source = args_check.input_source(args)
 
+    if args.no_cache:
+        status_cache = None
+    else:
+        status_cache = cache.StatusCache(
+            cache.default_path(), ttl=args.cache_ttl * 86400
+        )
+
     if input_source == "user":
         log.debug("Input source = user")
         # Auth
@@ -49,14 +62,57 @@ def get_tweets(args):
         api.get_user_info(twitter_api, args.screen_name)
 
         # Download
-        if args.limit and args.limit <= 3200:
-            geo_tweets = api.download_tweets(
-                twitter_api, args.screen_name, limit=args.limit
-            )
+        if args.incremental and args.limit is None:
+            # The API only returns the last 3200 tweets of a timeline
+            args.limit = 3200
+        if args.incremental and args.limit and args.limit <= 3200:
+            with run_report.stage("download"):
+                geo_tweets = api.sync_tweets(
+                    twitter_api,
+                    args.screen_name,
+                    limit=args.limit,
+                    checkpoint=cache.TimelineCheckpoint(args.screen_name),
+                    journal=journal.Journal(
+                        f"timeline:{args.screen_name.lower()}", args.resume
+                    ),
+                )
+        elif args.limit and args.limit <= 3200:
+            with run_report.stage("download"):
+                geo_tweets = api.download_tweets(
+                    twitter_api,
+                    args.screen_name,
+                    limit=args.limit,
+                    journal=journal.Journal(
+                        f"timeline:{args.screen_name.lower()}", args.resume
+                    ),
+                )
         else:
-            ids = scrape.get_ids(args.screen_name, args.limit)
-            tweets = api.hydrate(ids, twitter_api)
-            geo_tweets = [t for t in tweets if results.is_geo(t)]
+            if args.incremental:
+                log.info(
+                    "Note: --incremental only applies to the last 3200 tweets (-l)."
+                )
+            scrape_journal = journal.Journal(
+                f"scrape:{args.screen_name.lower()}:{args.limit}", args.resume
+            )
+            # Scraped IDs are committed first, hydrated chunks after them
+            scraped = [b["ids"] for b in scrape_journal.batches if "ids" in b]
+            if scraped:
+                ids = scraped[0]
+            else:
+                from .utils import scrape
+
+                with run_report.stage("scrape"):
+                    ids = scrape.get_ids(args.screen_name, args.limit)
+                scrape_journal.append({"ids": ids})
+            run_report.count("scraped_ids", len(ids))
+            twitter_apis = [
+                api.authenticate(keys) for keys in api.get_all_keys(args.config_path)
+            ]
+            with run_report.stage("hydrate"):
+                tweets = api.hydrate(ids, twitter_apis, status_cache, scrape_journal)
+            run_report.count("hydrated_tweets", len(tweets))
+            with run_report.stage("geo_filter"):
+                geo_tweets = [t for t in tweets if results.is_geo(t)]
 
     elif input_source == "file":
         log.debug("Input source = file")
@@ -64,9 +120,21 @@ def get_tweets(args):
             log.info(
                 "Note: Limit argument (-l) has no effect when mapping from a file."
             )
-        geo_tweets = import_file.process_tweets(args.input_file, args.config_path)
+        # Parsing and geo filtering are interleaved when reading a file
+        with run_report.stage("read_file"):
+            geo_tweets = import_file.process_tweets(
+                args.input_files,
+                args.config_path,
+                jobs=args.jobs,
+                cache=status_cache,
+                resume=args.resume,
+            )
+
+    if status_cache:
+        status_cache.close()
 
     results.check(geo_tweets)
+    run_report.count("geo_tweets", len(geo_tweets))
 
     return geo_tweets
 
@@ -74,29 +142,66 @@ def get_tweets(args):
 def tweetsmapper(args):
     """Main logic."""
     if args.configure:
+        from .utils import api
+
         api.configure(args.config_path)
     else:
+        from .utils import map
 
-        geo_tweets = get_tweets(args)
-
-        # Initialize Leaflet map
-        tweets_map = map.create()
-        # Initialize Leaflet MarkerCluster & FeatureGroupSubGroups
-        tweets_cluster = map.add_cluster(tweets_map)
-
-        map.add_tweets(
-            geo_tweets=geo_tweets, cluster=tweets_cluster, tweets_map=tweets_map
+        run_report = report.RunReport(
+            args.profile or args.profile_render,
+            cprofile_stage="render" if args.profile_render else None,
+        )
+        geo_tweets = get_tweets(args, run_report)
+        args.render = args_check.render_mode(args.render, len(geo_tweets))
+        # Split assets, canvas and preclustered maps always build popups in
+        # the browser
+        args.lazy_popups = (
+            args.lazy_popups or args.split_assets or args.render != "markers"
         )
-        # Customize map
-        tweets_map = map.customize(tweets_map, args, geo_tweets)
+        if args.aggregate is not None and args.render != "markers":
+            log.info("Note: --aggregate only applies to markers (--render markers).")
+            args.aggregate = None
+
+        with run_report.stage("assemble"):
+            # Initialize Leaflet map
+            tweets_map = map.create()
+            # Initialize Leaflet MarkerCluster & FeatureGroupSubGroups
+            if args.render == "markers":
+                tweets_cluster = map.add_cluster(
+                    tweets_map, aggregate=args.aggregate is not None
+                )
+            else:
+                tweets_cluster = None
+
+            map.add_tweets(
+                geo_tweets=geo_tweets,
+                tweets_cluster=tweets_cluster,
+                tweets_map=tweets_map,
+                lazy_popups=args.lazy_popups,
+                data_url=map.DATA_FILE if args.split_assets else None,
+                render=args.render,
+                jobs=args.jobs,
+                aggregate=args.aggregate,
+            )
+            # Customize map
+            tweets_map = map.customize(tweets_map, args, geo_tweets)
+
+        # Save map (marker popups are rendered while writing it)
+        with run_report.stage("render"):
+            output_path = map.save(tweets_map, args)
+        run_report.count("render_mode", args.render)
 
-        # Save map
-        map.save(tweets_map, args)
+        # Save the run report next to the map
+        if args.split_assets:
+            run_report.save(os.path.join(output_path, "profile.json"))
+        else:
+            run_report.save(os.path.splitext(output_path)[0] + ".profile.json")
 
 
 def main():
     banner = "tweetsmapper v{} - (C) r3mlab - GPLv3 License - https://github.com/r3mlab/tweetsmapper".format(
-        pkg_resources.get_distribution("tweetsmapper").version
+        __version__
     )
     log.info(banner)
     # Parse arguments
@@ -119,8 +224,13 @@ def main():
     exclusive.add_argument(
         "-i",
         "--input-file",
+        dest="input_files",
+        nargs="+",
         type=args_check.input_file,
-        help="Path to a collection of tweets. Supports: JSONL, TXT",
+        help="Paths to collections of tweets: files, globs or directories "
+        "(only their JSONL files). Tweets found in several files are only "
+        "mapped once. Supports: JSONL, TXT, optionally compressed (gz, bz2, "
+        "xz, zst)",
         metavar="INPUT_FILE",
     )
 
@@ -148,6 +258,94 @@ def main():
         metavar="CUSTOM_TITLE",
     )
 
+    parser.add_argument(
+        "--lazy-popups",
+        action="store_true",
+        help="Build tweet popups in the browser when a marker is clicked "
+        "(smaller and faster to generate maps)",
+    )
+
+    parser.add_argument(
+        "--render",
+        choices=["auto", "markers", "canvas", "preclustered"],
+        default="auto",
+        help="Draw tweets as clustered markers, as points on a canvas for "
+        "very large maps, or as clusters computed when generating the map "
+        "(default = auto: canvas above {} tweets)".format(
+            args_check.CANVAS_THRESHOLD
+        ),
+    )
+
+    parser.add_argument(
+        "--aggregate",
+        type=args_check.precision,
+        help="Show tweets at the same location, once rounded to DIGITS "
+        "decimals (e.g. 4, about 10 m), as one marker listing them",
+        metavar="DIGITS",
+    )
+
+    parser.add_argument(
+        "--split-assets",
+        action="store_true",
+        help="Save the map as a directory with an HTML shell, cacheable CSS/JS "
+        "bundles and the tweets data in a separate file (needs to be served "
+        "over HTTP, implies --lazy-popups)",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to read a JSONL file and to render "
+        "popups (default = 1)",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only download the tweets of the user (-n) posted since the "
+        "previous --incremental run, and map them with those already found "
+        "(the first run downloads the last 3200 tweets, or -l N)",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue downloading or hydrating tweets where an interrupted "
+        "run stopped",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Fetch all tweets from the API instead of reusing those hydrated "
+        "by previous runs",
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=cache.DEFAULT_TTL_DAYS,
+        help="Number of days hydrated tweets are kept in cache "
+        "(default = {})".format(cache.DEFAULT_TTL_DAYS),
+        metavar="DAYS",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Save the time and memory spent in each stage to a JSON report "
+        "next to the map",
+    )
+
+    parser.add_argument(
+        "--profile-render",
+        action="store_true",
+        help="Also save cProfile stats of the render stage (implies --profile)",
+    )
+
     exclusive.add_argument(
         "--configure", action="store_true", help="Configure Twitter API credentials"
     )
@@ -161,5 +359,7 @@ def main():
     )
 
     args = parser.parse_args()
+    if args.input_files:
+        args.input_files = args_check.input_files(args.input_files)
 
     tweetsmapper(args)
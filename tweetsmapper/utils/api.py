@@ -25,14 +25,22 @@ API Actions
 import logging
 import os
 import configparser
+import queue
+import threading
 import tweepy
 from tqdm import tqdm
 
 from tweetsmapper.utils import results
+from tweetsmapper.utils.models import GeoTweet
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("tweetsmapper-api")
 
+# Number of timeline statuses per journal batch
+JOURNAL_BATCH_SIZE = 200
+# Number of most recent statuses of a timeline returned by the API
+TIMELINE_LIMIT = 3200
+
 
 def check_keys_env():
     """Check if API credentials are defined through environment variables."""
@@ -123,6 +131,31 @@ def validate_keys(twitter_api):
         log.debug(f"Error: {e}")
 
 
+def read_config(config_path):
+    """Read the config file, at its default path if none is given."""
+    config = configparser.ConfigParser()
+
+    if config_path == None:
+        log.debug(f"No custom config file specified")
+        log.debug("Setting config file path to default")
+        config_path = os.path.join(os.path.expanduser("~"), ".tweetsmapper")
+
+    log.debug(f"Reading config file {config_path}...")
+    config.read(config_path)
+    return config
+
+
+def profile_keys(config, profile):
+    """Get the api credentials of a config file profile."""
+    keys = {}
+    keys["consumer_key"] = config.get(profile, "consumer_key")
+    keys["consumer_secret"] = config.get(profile, "consumer_secret")
+    keys["access_token"] = config.get(profile, "access_token")
+    keys["access_token_secret"] = config.get(profile, "access_token_secret")
+    log.debug(f"Keys: {keys}")
+    return keys
+
+
 def get_keys(config_path):
     """Get the api credentials from env variables or from a file.
 
@@ -139,24 +172,23 @@ def get_keys(config_path):
         log.debug(f"Keys: {keys}")
     else:
         log.debug("Trying to get API keys from config file")
-        config = configparser.ConfigParser()
+        config = read_config(config_path)
+        keys = profile_keys(config, config.sections()[0])
 
-        if config_path == None:
-            log.debug(f"No custom config file specified")
-            log.debug("Setting config file path to default")
-            config_path = os.path.join(os.path.expanduser("~"), ".tweetsmapper")
+    return keys
 
-        log.debug(f"Reading config file {config_path}...")
-        config.read(config_path)
-        profile = config.sections()[0]
 
-        keys["consumer_key"] = config.get(profile, "consumer_key")
-        keys["consumer_secret"] = config.get(profile, "consumer_secret")
-        keys["access_token"] = config.get(profile, "access_token")
-        keys["access_token_secret"] = config.get(profile, "access_token_secret")
-        log.debug(f"Keys: {keys}")
+def get_all_keys(config_path):
+    """Get the api credentials of every profile of the config file.
 
-    return keys
+    Env variables hold a single set of credentials and have the same
+    priority as in get_keys."""
+    if check_keys_env() and config_path is None:
+        return [get_keys(config_path)]
+
+    log.debug("Trying to get API keys of all profiles from config file")
+    config = read_config(config_path)
+    return [profile_keys(config, profile) for profile in config.sections()]
 
 
 def configure(config_path):
@@ -245,30 +277,116 @@ def get_user_info(twitter_api, screen_name):
         raise SystemExit(1)
 
 
-def download_tweets(twitter_api, screen_name, limit):
-    """Download tweets from the API and filter those containing geo information."""
+def download_statuses(twitter_api, screen_name, limit, since_id=None, journal=None):
+    """Download the statuses JSON of a user timeline, newest first.
 
-    log.info(f"Trying to download last {limit} tweets for user {screen_name}...")
+    With since_id, only statuses more recent than this ID are downloaded.
+    With a journal (see journal.Journal), statuses are committed to it by
+    batches, and the download resumes after those it already holds."""
+    if since_id:
+        log.info(
+            f"Trying to download tweets for user {screen_name} since tweet {since_id}..."
+        )
+    else:
+        log.info(f"Trying to download last {limit} tweets for user {screen_name}...")
 
-    log.debug("Checking if user exists...")
+    journaled = []
+    for batch in journal.batches if journal else []:
+        journaled.extend(batch["statuses"])
+    max_id = min(s["id"] for s in journaled) - 1 if journaled else None
 
     log.debug("Starting to download tweets...")
     tweets_list = tweepy.Cursor(
-        twitter_api.user_timeline, screen_name=screen_name, tweet_mode="extended"
-    ).items(limit)
-
-    geo_tweets = []
+        twitter_api.user_timeline,
+        screen_name=screen_name,
+        tweet_mode="extended",
+        since_id=since_id,
+        max_id=max_id,
+    ).items(limit - len(journaled))
+
+    done = False
     try:
         count = 0
-        for tweet in tqdm(tweets_list, unit=" tweets", total=limit):
+        pbar = tqdm(unit=" tweets", total=limit)
+        for status in journaled:
+            count += 1
+            pbar.update()
+            yield status
+        batch = []
+        for status in tweets_list:
             count += 1
-            if results.is_geo(tweet):
-                geo_tweets.append(tweet)
-        if count != limit:
+            pbar.update()
+            yield status._json
+            if journal:
+                batch.append(status._json)
+                if len(batch) == JOURNAL_BATCH_SIZE:
+                    journal.append({"statuses": batch})
+                    batch = []
+        pbar.close()
+        if since_id:
+            log.info(f"Fetched {count} new tweets.")
+        elif count != limit:
             log.info(f"Could only fetch {count} tweets.")
+        done = True
     except tweepy.error.TweepError as error:
         log.error(f"Twitter error: {error}")
         raise SystemExit(1)
+    finally:
+        if journal:
+            journal.close(done)
+
+
+def download_tweets(twitter_api, screen_name, limit, journal=None):
+    """Download tweets from the API and filter those containing geo information."""
+    geo_tweets = []
+    users, places = {}, {}
+    for status in download_statuses(twitter_api, screen_name, limit, journal=journal):
+        tweet = GeoTweet.from_json(status, users, places)
+        if results.is_geo(tweet):
+            geo_tweets.append(tweet)
+
+    return geo_tweets
+
+
+def sync_tweets(twitter_api, screen_name, limit, checkpoint, journal=None):
+    """Download the geo tweets of a user more recent than its checkpoint
+    (see cache.TimelineCheckpoint), and merge them with the stored ones.
+
+    limit only applies to the first run: later runs download all statuses
+    since the checkpoint, as far as the API goes back (TIMELINE_LIMIT)."""
+    since_id, stored_statuses = checkpoint.load()
+    if since_id:
+        limit = TIMELINE_LIMIT
+
+    geo_tweets = []
+    new_statuses = []
+    max_id = since_id
+    count = 0
+    users, places = {}, {}
+    for status in download_statuses(
+        twitter_api, screen_name, limit, since_id, journal
+    ):
+        count += 1
+        max_id = max(max_id or 0, status["id"])
+        tweet = GeoTweet.from_json(status, users, places)
+        if results.is_geo(tweet):
+            geo_tweets.append(tweet)
+            new_statuses.append(status)
+
+    new_ids = {tweet.id for tweet in geo_tweets}
+    stored_statuses = [s for s in stored_statuses if s["id"] not in new_ids]
+    log.info(
+        f"Found {len(new_statuses)} new and {len(stored_statuses)} stored geo tweets."
+    )
+    geo_tweets.extend(
+        GeoTweet.from_json(status, users, places) for status in stored_statuses
+    )
+    if since_id and count >= limit:
+        log.info(
+            f"More than {limit} new tweets since the previous run: older ones "
+            "are out of reach of the API and missing from the map."
+        )
+    checkpoint.save(max_id, new_statuses + stored_statuses)
 
     return geo_tweets
 
@@ -279,17 +397,92 @@ def chunks(list, chunk_size):
         yield list[i : i + chunk_size]
 
 
-def hydrate(ids_list, twitter_api):
+def lookup(twitter_api, pending, fetched):
+    """Fetch the chunks of statuses left in pending with an API, putting each
+    chunk and its statuses (or the error raised) in fetched."""
+    while True:
+        try:
+            chunk = pending.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            statuses = twitter_api.statuses_lookup(chunk, tweet_mode="extended")
+            fetched.put((chunk, [status._json for status in statuses]))
+        except Exception as error:
+            fetched.put((chunk, error))
+
+
+def hydrate(ids_list, twitter_apis, cache=None, journal=None):
+    """Fetch tweets from their IDs and return them as GeoTweet records.
+
+    Chunks of IDs are fetched concurrently, one at a time per API (each
+    authenticated with its own credentials, so waiting for its own rate
+    limit). With a cache (see cache.StatusCache), only IDs missing from it
+    are fetched from the API, and fetched statuses are added to it. With a
+    journal (see journal.Journal), chunks are committed to it as they are
+    fetched, and those it already holds are not fetched again."""
     log.info("Hydrating tweets...")
+    valid_ids = [id for id in ids_list if str(id).isdigit()]
+    if len(valid_ids) < len(ids_list):
+        log.info(f"Skipped {len(ids_list) - len(valid_ids)} invalid tweet IDs.")
+    ids_list = list(dict.fromkeys(int(id) for id in valid_ids))
+    statuses = cache.get_many(ids_list) if cache else {}
+    if cache:
+        log.info(f"Found {len(statuses)} of {len(ids_list)} tweets in cache.")
+    for batch in journal.batches if journal else []:
+        if "chunk" in batch:
+            statuses.update(dict.fromkeys(batch["chunk"]))
+            statuses.update((status["id"], status) for status in batch["statuses"])
+    misses = [id for id in ids_list if id not in statuses]
+
+    id_chunks = list(chunks(misses, 100))
+    pending, fetched = queue.Queue(), queue.Queue()
+    for chunk in id_chunks:
+        pending.put(chunk)
+    log.debug(f"Hydrating with {len(twitter_apis)} API credentials...")
+
+    done = False
     try:
-        pbar = tqdm(unit=" tweets", total=len(ids_list))
-        all_statuses = []
-        for chunk in chunks(ids_list, 100):
-            statuses = twitter_api.statuses_lookup(chunk, tweet_mode="extended")
-            all_statuses.extend(statuses)
-            pbar.update(len(chunk))
+        pbar = tqdm(unit=" tweets", total=len(misses))
+        # One daemon thread per API, so that an error or a Ctrl-C does not
+        # wait for the lookups in flight (up to 15 minutes on a rate limit)
+        for twitter_api in twitter_apis:
+            threading.Thread(
+                target=lookup, args=(twitter_api, pending, fetched), daemon=True
+            ).start()
+        try:
+            for _ in id_chunks:
+                chunk, chunk_statuses = fetched.get()
+                if isinstance(chunk_statuses, Exception):
+                    raise chunk_statuses
+                for status in chunk_statuses:
+                    statuses[status["id"]] = status
+                if cache:
+                    cache.put_many(
+                        chunk_statuses,
+                        [id for id in chunk if statuses.get(id) is None],
+                    )
+                if journal:
+                    journal.append({"chunk": chunk, "statuses": chunk_statuses})
+                pbar.update(len(chunk))
+        finally:
+            # Workers stop after their current chunk
+            while not pending.empty():
+                pending.get_nowait()
         pbar.close()
-        return all_statuses
+        done = True
     except tweepy.error.TweepError as error:
         log.error(f"Twitter error: {error}")
         raise SystemExit(1)
+    finally:
+        if journal:
+            journal.close(done)
+
+    # Records follow the order of the IDs list, whatever the order chunks
+    # were fetched in
+    users, places = {}, {}
+    return [
+        GeoTweet.from_json(statuses[id], users, places)
+        for id in ids_list
+        if statuses.get(id)
+    ]
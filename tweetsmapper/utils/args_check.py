@@ -25,11 +25,22 @@ Argument checks
 import logging
 import os
 import argparse
+import glob
+
+from tweetsmapper.utils import compression
 
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("tweetsmapper-argscheck")
 
+# Above this number of tweets, the "auto" render mode draws them on a canvas
+CANVAS_THRESHOLD = 50000
+
+SUPPORTED_FILETYPES = ["jsonl", "txt"]
+# Filetypes read from directories: any .txt file there is not necessarily
+# a list of tweet IDs, so they have to be named explicitly (or by a glob)
+COLLECTION_FILETYPES = ["jsonl"]
+
 
 def screen_name(screen_name):
     """Remove @ in screen name if needed."""
@@ -39,23 +50,61 @@ def screen_name(screen_name):
     return screen_name
 
 
-def input_file(path):
-    """Checks if the input file has valid path and filetype."""
+def supported_message():
+    return "Supported extensions: {}, optionally compressed: {}".format(
+        " ".join(SUPPORTED_FILETYPES), " ".join(compression.MAGIC_BYTES)
+    )
 
-    if os.path.exists(path) is False:
-        raise argparse.ArgumentTypeError(f"Could not find file {path}")
-    log.debug("Found input file: {path}")
-    suffix = os.path.splitext(path)[1].lower()[1:]
-    supported_filetypes = ["jsonl", "txt"]
 
-    if suffix in supported_filetypes:
-        return path
+def is_supported(path, filetypes=SUPPORTED_FILETYPES):
+    path = compression.strip_extension(path)
+    return os.path.splitext(path)[1].lower()[1:] in filetypes
+
+
+def input_file(path):
+    """Expand a file, glob or directory into the list of input files it
+    stands for, and check their filetype.
+
+    Directories are searched recursively, and only their collections of
+    tweets (.jsonl files, compressed or not) are kept."""
+    if glob.escape(path) != path and not os.path.exists(path):
+        paths = sorted(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+        if not paths:
+            raise argparse.ArgumentTypeError(f"No file matches {path}")
+    elif os.path.isdir(path):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if is_supported(name, COLLECTION_FILETYPES)
+        )
+        if not paths:
+            raise argparse.ArgumentTypeError(
+                "No .jsonl file to process in directory {}. Lists of tweet IDs "
+                "(.txt) have to be given by name or glob.".format(path)
+            )
+    elif os.path.exists(path):
+        paths = [path]
     else:
-        raise argparse.ArgumentTypeError(
-            "Cannot process file {}. Supported extensions: {}".format(
-                path, " ".join(supported_filetypes)
+        raise argparse.ArgumentTypeError(f"Could not find file {path}")
+
+    for path in paths:
+        if not is_supported(path):
+            raise argparse.ArgumentTypeError(
+                "Cannot process file {}. {}".format(path, supported_message())
             )
-        )
+    log.debug(f"Found input files: {' '.join(paths)}")
+    return paths
+
+
+def input_files(paths_lists):
+    """Flatten the lists of input files of each -i argument, dropping
+    files given twice."""
+    files = {}
+    for paths in paths_lists:
+        for path in paths:
+            files.setdefault(os.path.abspath(path), path)
+    return list(files.values())
 
 
 def output_path(path):
@@ -67,11 +116,19 @@ def output_path(path):
         raise argparse.ArgumentTypeError(f"{path} is not a valid output path.")
 
 
+def precision(digits):
+    """Check the number of decimals locations are rounded to."""
+    digits = int(digits)
+    if not 0 <= digits <= 8:
+        raise argparse.ArgumentTypeError("Precision must be between 0 and 8.")
+    return digits
+
+
 def input_source(args):
     """Check if we should map tweets for a username or from a file."""
     if args.screen_name:
         return "user"
-    elif args.input_file:
+    elif args.input_files:
         return "file"
     else:
         log.critical(
@@ -87,3 +144,11 @@ def config_file(path):
     if not os.path.exists(path):
         raise argparse.ArgumentTypeError(f"{path} is not a valid path.")
     log.debug(f"Found configuration file: {path}")
+
+
+def render_mode(render, tweets_count):
+    """Choose between DOM markers and canvas points to render tweets."""
+    if render == "auto":
+        render = "canvas" if tweets_count > CANVAS_THRESHOLD else "markers"
+        log.debug(f"Render mode: {render}")
+    return render
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Hydrated statuses cache and user timelines checkpoints
+"""
+
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger("tweetsmapper-cache")
+
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_ENTRIES = 1000000
+
+# SQLite limits the number of parameters of a query
+BATCH_SIZE = 500
+
+
+def cache_dir():
+    """Return the tweetsmapper directory in the user cache directory."""
+    user_cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(user_cache_dir, "tweetsmapper")
+
+
+def default_path():
+    """Return the default cache file path, in the user cache directory."""
+    return os.path.join(cache_dir(), "statuses.sqlite")
+
+
+class StatusCache:
+    """SQLite cache of statuses JSON, keyed by tweet ID.
+
+    Statuses are stored as zlib compressed JSON. IDs the API did not
+    return (deleted or protected tweets) are stored as negative entries,
+    with a NULL status. Entries older than ttl seconds are ignored, and
+    the oldest entries are evicted above max_entries. The database is only
+    opened when first used."""
+
+    def __init__(
+        self,
+        path,
+        ttl=DEFAULT_TTL_DAYS * 86400,
+        max_entries=DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            log.debug(f"Opening cache {self.path}...")
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS statuses ("
+                "id INTEGER PRIMARY KEY, fetched_at REAL NOT NULL, status BLOB)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS statuses_fetched_at "
+                "ON statuses (fetched_at)"
+            )
+        return self._connection
+
+    def get_many(self, ids):
+        """Return the cached statuses of ids, as {id: status JSON or None}.
+
+        None marks a negative entry, IDs missing from the cache are left
+        out of the result."""
+        oldest = time.time() - self.ttl
+        found = {}
+        ids = list(ids)
+        for i in range(0, len(ids), BATCH_SIZE):
+            batch = ids[i : i + BATCH_SIZE]
+            rows = self.connection.execute(
+                "SELECT id, status FROM statuses WHERE fetched_at >= ? AND id IN ({})".format(
+                    ",".join("?" * len(batch))
+                ),
+                [oldest] + batch,
+            )
+            for id, status in rows:
+                found[id] = json.loads(zlib.decompress(status)) if status else None
+        return found
+
+    def put_many(self, statuses, missing_ids=()):
+        """Store fetched statuses and negative entries for missing_ids."""
+        now = time.time()
+        rows = [
+            (
+                status["id"],
+                now,
+                zlib.compress(json.dumps(status, separators=(",", ":")).encode()),
+            )
+            for status in statuses
+        ]
+        rows.extend((id, now, None) for id in missing_ids)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO statuses (id, fetched_at, status) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def evict(self):
+        """Delete expired entries, then the oldest ones above max_entries."""
+        with self.connection:
+            expired = self.connection.execute(
+                "DELETE FROM statuses WHERE fetched_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM statuses"
+            ).fetchone()
+            excess = max(count - self.max_entries, 0)
+            if excess:
+                self.connection.execute(
+                    "DELETE FROM statuses WHERE id IN "
+                    "(SELECT id FROM statuses ORDER BY fetched_at LIMIT ?)",
+                    (excess,),
+                )
+        log.debug(f"Evicted {expired} expired and {excess} old cache entries.")
+
+    def close(self):
+        if self._connection is not None:
+            self.evict()
+            self._connection.close()
+            self._connection = None
+
+
+class TimelineCheckpoint:
+    """Geo statuses already found in a user timeline, and the highest
+    tweet ID seen, stored as gzipped JSON in the user cache directory."""
+
+    def __init__(self, screen_name, path=None):
+        self.screen_name = screen_name
+        self.path = path or os.path.join(
+            cache_dir(), "timelines", f"{screen_name.lower()}.json.gz"
+        )
+
+    def load(self):
+        """Return the highest tweet ID seen and the stored geo statuses."""
+        if not os.path.exists(self.path):
+            log.debug(f"No checkpoint for user {self.screen_name}")
+            return None, []
+        with gzip.open(self.path, "rt", encoding="utf-8") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        log.debug(
+            "Checkpoint for user {}: {} geo tweets, since_id {}".format(
+                self.screen_name, len(checkpoint["statuses"]), checkpoint["since_id"]
+            )
+        )
+        return checkpoint["since_id"], checkpoint["statuses"]
+
+    def save(self, since_id, statuses):
+        """Replace the checkpoint, atomically so that it is never left
+        half written."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as checkpoint_file:
+            json.dump(
+                {"since_id": since_id, "statuses": statuses},
+                checkpoint_file,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Server-side clustering
+"""
+
+import logging
+import math
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger("tweetsmapper-cluster")
+
+# Zoom levels of the map (see map.create), clusters are computed up to
+# MAX_ZOOM and tweets are all shown individually above it
+MIN_ZOOM = 2
+MAX_ZOOM = 17
+# Same as Leaflet.markercluster's default maxClusterRadius, in pixels
+RADIUS = 80
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798
+
+
+def project(lat, lon):
+    """Project points (scalars or arrays) to Web Mercator, scaled to [0, 1]."""
+    sin = np.sin(np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)))
+    return lon / 360 + 0.5, 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+
+
+def unproject(x, y):
+    """Convert [0, 1] Web Mercator points (scalars or arrays) back to
+    (lat, lon)."""
+    lat = np.degrees(2 * np.arctan(np.exp((0.5 - y) * 2 * math.pi))) - 90
+    return lat, (x - 0.5) * 360
+
+
+def cluster_level(x, y, counts, expansion_zooms, zoom):
+    """Merge the items of the zoom level above that fall in the same cell of a
+    grid as large as the cluster radius at this zoom.
+
+    Items are given as arrays of their position, number of tweets and
+    expansion zoom. Returns the same arrays for the merged items, and the
+    index of the merged item of each item."""
+    size = RADIUS / (TILE_SIZE * 2 ** zoom)
+    side = int(1 / size) + 2
+    cells_x = np.floor(x / size).astype(np.int64)
+    cells_y = np.floor(y / size).astype(np.int64)
+    _, parents = np.unique(cells_x * side + cells_y, return_inverse=True)
+    parents = parents.ravel()
+
+    # Clusters are at the weighted centroid of their items
+    merged_counts = np.bincount(parents, weights=counts)
+    merged_x = np.bincount(parents, weights=x * counts) / merged_counts
+    merged_y = np.bincount(parents, weights=y * counts) / merged_counts
+
+    # A cluster made of a single cluster of the level above expands like it
+    children = np.bincount(parents)
+    merged_expansion_zooms = np.full(len(children), zoom + 1)
+    only_child = (children == 1)[parents]
+    merged_expansion_zooms[parents[only_child]] = expansion_zooms[only_child]
+
+    return (
+        merged_x,
+        merged_y,
+        merged_counts.astype(np.int64),
+        merged_expansion_zooms,
+        parents,
+    )
+
+
+def tiles_index(x, y, zoom, items):
+    """Group items by the tile of their position at zoom, as a dict keyed by
+    "x,y" tile coordinates."""
+    scale = 2 ** zoom
+    tiles_x = np.clip(np.floor(x * scale), 0, scale - 1).astype(np.int64).tolist()
+    tiles_y = np.clip(np.floor(y * scale), 0, scale - 1).astype(np.int64).tolist()
+    tiles = {}
+    for tile_x, tile_y, item in zip(tiles_x, tiles_y, items):
+        tiles.setdefault(f"{tile_x},{tile_y}", []).append(item)
+    return tiles
+
+
+def stack(x, y, indexes):
+    """Group tweets at the same position (e.g. the place-only tweets of a
+    place), to be shown as one marker.
+
+    Returns the positions of the groups, and for each the index of its tweet
+    or the list of the indexes of its tweets."""
+    stacks = {}
+    for position, index in zip(zip(x.tolist(), y.tolist()), indexes.tolist()):
+        stacks.setdefault(position, []).append(index)
+    positions = np.array(list(stacks), dtype=np.float64).reshape(-1, 2)
+    items = [tweets[0] if len(tweets) == 1 else tweets for tweets in stacks.values()]
+    return positions[:, 0], positions[:, 1], items
+
+
+def hierarchy(tweets_x, tweets_y, indexes, min_zoom, max_zoom):
+    """Compute the clusters of a set of tweets for every zoom level.
+
+    Returns one level per zoom from min_zoom to max_zoom + 1, with the
+    clusters of this zoom as [lat, lon, count, expansion_zoom] and the
+    indexes of the tweets shown on their own from this zoom, both grouped
+    by tile (see tiles_index). Above max_zoom, tweets at the same position
+    are grouped as a list of indexes (see stack)."""
+    x, y = tweets_x, tweets_y
+    counts = np.ones(len(indexes), dtype=np.int64)
+    expansion_zooms = np.full(len(indexes), max_zoom + 1)
+    # Item of each tweet at the current level
+    items = np.arange(len(indexes))
+    single_zooms = np.full(len(indexes), max_zoom + 1)
+
+    clusters = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        x, y, counts, expansion_zooms, parents = cluster_level(
+            x, y, counts, expansion_zooms, zoom
+        )
+        items = parents[items]
+        single_zooms[counts[items] == 1] = zoom
+
+        is_cluster = counts > 1
+        lat, lon = unproject(x[is_cluster], y[is_cluster])
+        clusters[zoom] = tiles_index(
+            x[is_cluster],
+            y[is_cluster],
+            zoom,
+            zip(
+                np.round(lat, 6).tolist(),
+                np.round(lon, 6).tolist(),
+                counts[is_cluster].tolist(),
+                expansion_zooms[is_cluster].tolist(),
+            ),
+        )
+        log.debug(f"Zoom {zoom}: {len(counts)} clusters and single tweets.")
+
+    levels = []
+    for zoom in range(min_zoom, max_zoom + 2):
+        is_single = single_zooms == zoom
+        x, y = tweets_x[is_single], tweets_y[is_single]
+        # Up to max_zoom, tweets at the same position are always clustered
+        if zoom > max_zoom:
+            x, y, singles = stack(x, y, indexes[is_single])
+        else:
+            singles = indexes[is_single].tolist()
+        levels.append(
+            {
+                "clusters": clusters.get(zoom, {}),
+                "singles": tiles_index(x, y, zoom, singles),
+            }
+        )
+    return levels
+
+
+def precluster(coords, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """Compute the cluster hierarchies of tweets for every zoom level, from
+    their packed coordinates (see geo.coordinates).
+
+    Hierarchies are computed for all tweets, for tweets with coordinates
+    and for tweets with a place only, so that the browser can show the same
+    clusters as MarkerCluster when a layer is hidden."""
+    xs, ys = project(coords.lat, coords.lon)
+    layers = {
+        "all": np.ones(len(xs), dtype=bool),
+        "coordinates": coords.has_coordinates,
+        "place": ~coords.has_coordinates,
+    }
+    return {
+        "minZoom": min_zoom,
+        "maxZoom": max_zoom,
+        "layers": {
+            name: hierarchy(
+                xs[in_layer],
+                ys[in_layer],
+                np.flatnonzero(in_layer),
+                min_zoom,
+                max_zoom,
+            )
+            for name, in_layer in layers.items()
+        },
+    }
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compressed input files
+"""
+
+import logging
+import os
+import queue
+import threading
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger("tweetsmapper-compression")
+
+# Magic bytes of each supported compression, by file extension
+MAGIC_BYTES = {
+    "gz": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zst": b"\x28\xb5\x2f\xfd",
+}
+
+# Size of the decompressed blocks, and number of blocks decompressed ahead
+# of the reader
+BLOCK_SIZE = 1024 * 1024
+PREFETCH_BLOCKS = 8
+
+
+def strip_extension(path):
+    """Remove the compression extension of a path, if any."""
+    root, extension = os.path.splitext(path)
+    return root if extension.lower()[1:] in MAGIC_BYTES else path
+
+
+def compression(path):
+    """Return the compression of a file, from its extension or else from
+    its first bytes, or None if it is not compressed."""
+    extension = os.path.splitext(path)[1].lower()[1:]
+    if extension in MAGIC_BYTES:
+        return extension
+    with open(path, "rb") as input:
+        head = input.read(6)
+    for name, magic in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_input(path):
+    """Open a file for binary reading, decompressing it on the fly."""
+    kind = compression(path)
+    if kind is None:
+        return open(path, "rb")
+    log.debug(f"Reading {kind} compressed file {path}")
+    if kind == "gz":
+        import gzip
+
+        return gzip.open(path, "rb")
+    if kind == "bz2":
+        import bz2
+
+        return bz2.open(path, "rb")
+    if kind == "xz":
+        import lzma
+
+        return lzma.open(path, "rb")
+    try:
+        import zstandard
+    except ImportError:
+        log.error(
+            f"Reading {path} requires the zstandard package: pip install zstandard"
+        )
+        raise SystemExit(1)
+    return zstandard.ZstdDecompressor().stream_reader(
+        open(path, "rb"), read_across_frames=True
+    )
+
+
+def read_blocks(path):
+    """Yield the decompressed content of a file by blocks.
+
+    Blocks are decompressed ahead by a thread: decompressors release the
+    GIL, so decompression runs while the previous blocks are parsed."""
+    blocks = queue.Queue(PREFETCH_BLOCKS)
+    stop = threading.Event()
+
+    def decompress():
+        try:
+            with open_input(path) as input:
+                while not stop.is_set():
+                    block = input.read(BLOCK_SIZE)
+                    blocks.put(block)
+                    if not block:
+                        break
+        except BaseException as error:
+            blocks.put(error)
+
+    thread = threading.Thread(target=decompress, daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, BaseException):
+                raise block
+            if not block:
+                break
+            yield block
+    finally:
+        # Unblock the thread if reading stopped early
+        stop.set()
+        while thread.is_alive():
+            try:
+                blocks.get_nowait()
+            except queue.Empty:
+                thread.join(0.1)
+
+
+def read_lines(path):
+    """Yield the lines of a compressed file."""
+    rest = b""
+    for block in read_blocks(path):
+        lines = (rest + block).split(b"\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
@@ -24,17 +24,29 @@ Display, formatting, etc.
 
 import logging
 import datetime
+import functools
+import html
+import multiprocessing
 import os
-import jinja2
-import emoji
-from ttp import ttp
+import re
+from urllib.parse import quote
 
-from tweetsmapper.utils import services, resources_path
-import pkg_resources
+from tweetsmapper import __version__
+from tweetsmapper.utils import cache, services, resources_path
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("tweetsmapper-display")
 
+# Number of popups rendered by a worker process at once
+RENDER_BATCH_SIZE = 1000
+# Stands for the place tab in popups rendered by render_popups_batch
+PLACE_TAB_PLACEHOLDER = "<!-- place-tab -->"
+
+# Every emoji has a non ASCII character
+NON_ASCII_REGEX = re.compile("[^\x00-\x7f]")
+
+EMOJI_TEMPLATE = '<img draggable="false" class="emoji" alt="{char}" src="https://twemoji.maxcdn.com/2/72x72/{fileroot}.png">'
+
 
 def format_like(num):
     """Format an integer into Twitter like string."""
@@ -48,31 +60,157 @@ def format_like(num):
     return like_num
 
 
+def emoji_trie_pattern(node):
+    """Convert a character trie into a regex, preferring the longest match."""
+    alts = [re.escape(c) + emoji_trie_pattern(sub) for c, sub in node.items() if c]
+    if not alts:
+        return ""
+    if len(alts) == 1 and "" not in node:
+        return alts[0]
+    pattern = "(?:{})".format("|".join(alts))
+    return pattern + "?" if "" in node else pattern
+
+
+def char_ranges_class(chars):
+    """Build a compact regex character class from a set of characters."""
+    ranges = []
+    for code in sorted(ord(c) for c in chars):
+        if ranges and code == ranges[-1][1] + 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return "[{}]".format(
+        "".join(
+            re.escape(chr(a)) if a == b else re.escape(chr(a)) + "-" + re.escape(chr(b))
+            for a, b in ranges
+        )
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def emoji_regex():
+    """Compile a single regex matching every known emoji, longest first.
+
+    Built once per process from a trie of all emojis, so that full sequences
+    (flags, ZWJ families, keycaps) are preferred over their components.
+    A lookahead on the possible first characters lets the regex skip plain
+    text quickly. Emojis only differing from another one by a trailing
+    variation selector are left out, so the base Twemoji file is used."""
+    import emoji
+
+    known = emoji.UNICODE_EMOJI.keys()
+    trie = {}
+    for e in known:
+        if e.endswith("\ufe0f") and e[:-1] in known:
+            continue
+        node = trie
+        for char in e:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    return re.compile(
+        "(?={}){}".format(char_ranges_class(trie.keys()), emoji_trie_pattern(trie))
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def emoji_fileroot(char):
+    """Return the Twemoji file name (without extension) for an emoji."""
+    esc_char = char.encode("unicode-escape").lower()
+    esc_char_codes = esc_char.split(b"\\u")
+
+    fileroot_codes = [
+        x.decode("utf-8").replace("000", "") for x in esc_char_codes if x != b""
+    ]
+    return "-".join(fileroot_codes)
+
+
+def emoji_to_html(match):
+    """Convert an emoji regex match to a Twemoji html code."""
+    char = match.group(0)
+    return EMOJI_TEMPLATE.format(char=char, fileroot=emoji_fileroot(char))
+
+
 def format_tweet_emojis(tweet_text):
     """Detect emojis in tweet and replace them with a Twemoji html code.
 
     This is needed to display the most recent unicode emojis,
     many of which are unsupported by web browsers."""
-    emoji_template = '<img draggable="false" class="emoji" alt="{char}" src="https://twemoji.maxcdn.com/2/72x72/{fileroot}.png">'
+    return emoji_regex().sub(emoji_to_html, tweet_text)
 
-    for e in emoji.UNICODE_EMOJI.keys():
-        if e in tweet_text:
-            esc_char = e.encode("unicode-escape").lower()
-            esc_char_codes = esc_char.split(b"\\u")
 
-            fileroot_codes = [
-                x.decode("utf-8").replace("000", "") for x in esc_char_codes if x != b""
-            ]
-            fileroot = "-".join(fileroot_codes)
+LINK_TEMPLATE = '<a target="_blank" rel="noreferrer" href="{href}">{text}</a>'
+
+
+def unescape_tweet_text(tweet_text):
+    """Undo the HTML escaping of the API, that entity offsets ignore."""
+    return (
+        tweet_text.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+    )
+
+
+def valid_entities(text, entities):
+    """Check that entity offsets match the text they should point to."""
+    end = 0
+    for entity in entities:
+        if not end <= entity.start < entity.end <= len(text):
+            return False
+        end = entity.end
+        token = text[entity.start : entity.end]
+        if entity.kind == "hashtag":
+            valid = token[0] in "#＃" and token[1:] == entity.value
+        elif entity.kind == "mention":
+            valid = token[0] in "@＠" and token[1:].lower() == entity.value.lower()
+        else:
+            valid = token.startswith("http")
+        if not valid:
+            return False
+    return True
+
+
+def segment_to_html(segment):
+    """Escape a plain segment of tweet text and add its emojis."""
+    segment = html.escape(segment, quote=False)
+    if NON_ASCII_REGEX.search(segment):
+        return format_tweet_emojis(segment)
+    return segment
+
+
+def entity_to_html(token, entity):
+    """Convert an entity of a tweet text to a link."""
+    if entity.kind == "hashtag":
+        href = "https://twitter.com/search?q=" + quote("#" + entity.value)
+        text = html.escape(token, quote=False)
+    elif entity.kind == "mention":
+        href = "https://twitter.com/" + entity.value
+        text = html.escape(token, quote=False)
+    else:
+        href = html.escape(entity.value)
+        text = html.escape(entity.display, quote=False)
+    return LINK_TEMPLATE.format(href=href, text=text)
+
 
-            emoji_html = emoji_template.format(char=e, fileroot=fileroot)
-            tweet_text = tweet_text.replace(e, emoji_html)
+def format_tweet_text(tweet_text, entities=None):
+    """Convert tweet text to html: add mentions, hashtags, emoji, links.
 
-    return tweet_text
+    Links are built in one pass from the entities offsets given by the API.
+    Without entities, or if their offsets do not match the text, they are
+    detected by twitter-text-python instead."""
+    if entities is not None:
+        text = unescape_tweet_text(tweet_text)
+        if valid_entities(text, entities):
+            parts = []
+            position = 0
+            for entity in entities:
+                parts.append(segment_to_html(text[position : entity.start]))
+                parts.append(entity_to_html(text[entity.start : entity.end], entity))
+                position = entity.end
+            parts.append(segment_to_html(text[position:]))
+            return "".join(parts)
+        log.debug("Entities do not match tweet text, parsing it instead")
 
+    from ttp import ttp
 
-def format_tweet_text(tweet_text):
-    """Convert tweet text to html: add mentions, hashtags, emoji, links."""
     # Emoji support
     tweet_processed_text = format_tweet_emojis(tweet_text)
     # Mentions, hashtags, links
@@ -85,24 +223,52 @@ def format_tweet_text(tweet_text):
     return tweet_processed_text
 
 
-def get_template(template):
-    """Wrapper for jinja2 template loading."""
+@functools.lru_cache(maxsize=None)
+def template_environment():
+    """Create the jinja2 environment shared by all templates of the process.
+
+    Compiled templates are kept in memory by the environment, and on disk
+    in the user cache directory so that later runs skip compilation."""
+    import jinja2
+
     templates_dir = os.path.join(resources_path, "templates")
     file_loader = jinja2.FileSystemLoader(templates_dir)
-    env = jinja2.Environment(loader=file_loader)
-    return env.get_template(template)
+    bytecode_dir = os.path.join(cache.cache_dir(), "templates")
+    try:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_dir)
+    except OSError as error:
+        log.debug(f"No templates bytecode cache: {error}")
+        bytecode_cache = None
+    return jinja2.Environment(loader=file_loader, bytecode_cache=bytecode_cache)
 
 
-def tweet_to_html(tweet, tweet_template):
-    """Convert a Tweepy status object (tweet) to a Twitter-like HTML string."""
-    if tweet.coordinates:
-        search_services = services.from_coordinates
-    else:
-        search_services = services.from_place
+def get_template(template):
+    """Wrapper for jinja2 template loading."""
+    return template_environment().get_template(template)
+
+
+def place_to_html(place, place_template):
+    """Render the place tab of a popup."""
+    return place_template.render(place=place, services=services)
+
+
+def render_places(places):
+    """Render the place tab of each place."""
+    place_template = get_template("place-tab.html.j2")
+    return [place_to_html(place, place_template) for place in places]
+
+
+def tweet_to_html(tweet, tweet_template, place_tab=None):
+    """Convert a GeoTweet record to a Twitter-like HTML string.
 
+    place_tab is the HTML of the place tab, rendered here if not given."""
+    if tweet.place and place_tab is None:
+        place_tab = place_to_html(tweet.place, get_template("place-tab.html.j2"))
     html = tweet_template.render(
         tweet=tweet,
-        tweet_html_text=format_tweet_text(tweet.full_text),
+        place_tab=place_tab,
+        tweet_html_text=format_tweet_text(tweet.full_text, tweet.entities),
         tweet_date_str=tweet.created_at.strftime("%H:%M - %b %d, %Y (UTC)"),
         tweet_favcount=format_like(tweet.favorite_count),
         services=services,
@@ -110,6 +276,90 @@ def tweet_to_html(tweet, tweet_template):
     return html
 
 
+def render_popups_batch(geo_tweets):
+    """Render the popups of a batch of tweets, with PLACE_TAB_PLACEHOLDER
+    instead of their place tab (see render_places)."""
+    popup_template = get_template("popup.html.j2")
+    return [
+        tweet_to_html(tweet, popup_template, PLACE_TAB_PLACEHOLDER)
+        for tweet in geo_tweets
+    ]
+
+
+def iter_popups(geo_tweets, jobs=1):
+    """Render the popup HTML of every tweet, yielded in order.
+
+    With several jobs, batches of tweets are rendered by a pool of worker
+    processes."""
+    batches = (
+        geo_tweets[i : i + RENDER_BATCH_SIZE]
+        for i in range(0, len(geo_tweets), RENDER_BATCH_SIZE)
+    )
+    if jobs <= 1 or len(geo_tweets) <= RENDER_BATCH_SIZE:
+        for batch in batches:
+            yield from render_popups_batch(batch)
+        return
+
+    log.debug(f"Rendering popups with {jobs} processes.")
+    with multiprocessing.Pool(jobs) as pool:
+        for batch_popups in pool.imap(render_popups_batch, batches):
+            yield from batch_popups
+
+
+def tweets_to_data(geo_tweets, coords):
+    """Pack tweets into compact arrays for client-side popup rendering.
+
+    Locations are taken from coords (see geo.coordinates). Users and places
+    are stored once and referenced by index.
+    The layout is documented in resources/js/lazy_popups.js."""
+    users, places, tweets = {}, {}, []
+    locations = zip(
+        coords.lat.tolist(), coords.lon.tolist(), coords.has_coordinates.tolist()
+    )
+    for tweet, (lat, lon, has_coordinates) in zip(geo_tweets, locations):
+        user = tweet.user
+        if user.id not in users:
+            users[user.id] = (
+                len(users),
+                [
+                    user.screen_name,
+                    user.name,
+                    user.profile_image_url_https,
+                    user.verified,
+                ],
+            )
+        place = tweet.place
+        if place and place.id not in places:
+            places[place.id] = (
+                len(places),
+                [place.id, place.full_name, place.country, place.country_code],
+            )
+        tweets.append(
+            [
+                tweet.id_str,
+                lat,
+                lon,
+                1 if has_coordinates else 0,
+                format_tweet_text(tweet.full_text, tweet.entities),
+                tweet.created_at.strftime("%H:%M - %b %d, %Y (UTC)"),
+                str(format_like(tweet.favorite_count)),
+                users[user.id][0],
+                places[place.id][0] if place else -1,
+                list(tweet.media) if tweet.media else 0,
+            ]
+        )
+
+    return {
+        "users": [user for _, user in users.values()],
+        "places": [place for _, place in places.values()],
+        "tweets": tweets,
+        "services": {
+            "from_coordinates": services.from_coordinates,
+            "from_place": services.from_place,
+        },
+    }
+
+
 def create_legend(legend_title, emoji):
     """Create HTML for the legend in LayerControl."""
     legend_template = get_template("legend.html.j2")
@@ -117,7 +367,7 @@ def create_legend(legend_title, emoji):
         title=legend_title,
         emoji=emoji,
         gen_datetime=datetime.datetime.utcnow().strftime("%d %b %Y %I:%M %p"),
-        version=pkg_resources.get_distribution("tweetsmapper").version,
+        version=__version__,
     )
 
     return legend
@@ -125,7 +375,5 @@ def create_legend(legend_title, emoji):
 
 def create_title(string):
     """Create HTML for the <title> tag."""
-    title = "{} - tweetsmapper v{}".format(
-        string, pkg_resources.get_distribution("tweetsmapper").version
-    )
+    title = "{} - tweetsmapper v{}".format(string, __version__)
     return title
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Custom folium elements
+"""
+
+import json
+import os
+import folium
+from branca.element import MacroElement
+from folium.utilities import image_to_url
+from jinja2 import Template
+
+from tweetsmapper.utils import display, resources_path
+
+
+class SharedIcon(MacroElement):
+    """Leaflet icon defined once in the map script and shared by all markers."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.icon({{ this.options|tojson }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, icon_image, icon_size, icon_anchor, popup_anchor):
+        super().__init__()
+        self._name = "SharedIcon"
+        self.options = {
+            "iconUrl": image_to_url(icon_image),
+            "iconSize": icon_size,
+            "iconAnchor": icon_anchor,
+            "popupAnchor": popup_anchor,
+        }
+
+
+def tweet_icon():
+    """Create the Twitter marker icon."""
+    return SharedIcon(
+        os.path.join(resources_path, "img", "marker.png"),
+        icon_size=[36, 45],
+        icon_anchor=[18, 45],
+        popup_anchor=[0, -38],
+    )
+
+
+class StreamedMarkers(MacroElement):
+    """Tweet markers written to the map file one at a time.
+
+    The map is rendered with a placeholder instead of the markers script
+    (see map.write_map), which is then streamed from iter_scripts: popups
+    are rendered on the fly and never held all together in memory. Places
+    are written first, as an index of their centroid and place tab
+    rendered once, which markers reference. Markers are located from coords
+    (see geo.coordinates). cells are groups of tweet indexes sharing a
+    marker (see geo.aggregate), whose popup shows them one at a time."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            {{ this.placeholder }}
+        {% endmacro %}
+        """
+    )
+
+    _places_template = Template(
+        """
+        var {{ name }} = {{ places }};"""
+    )
+
+    _marker_template = Template(
+        """
+        L.marker({{ location }}, {icon: {{ icon }}}).addTo({{ group }}).bindPopup(
+            L.popup({"maxWidth": "100%"}).setContent($({{ content }})[0])
+        );"""
+    )
+
+    _cell_marker_template = Template(
+        """
+        L.marker({{ location }}, {icon: {{ icon }}, tweetsCount: {{ pages|length }}}).addTo({{ group }}).bindPopup(
+            L.popup({"maxWidth": "100%"}).setContent(function() {
+                return tweetsmapper.pagedPopup([{{ pages|join(", ") }}]);
+            })
+        );"""
+    )
+
+    def __init__(
+        self,
+        geo_tweets,
+        coords,
+        coords_subgroup,
+        place_subgroup,
+        shared_icon,
+        jobs=1,
+        cells=None,
+    ):
+        super().__init__()
+        self._name = "StreamedMarkers"
+        self.geo_tweets = geo_tweets
+        self.coords = coords
+        self.coords_subgroup = coords_subgroup
+        self.place_subgroup = place_subgroup
+        self.shared_icon = shared_icon
+        self.jobs = jobs
+        self.cells = cells
+
+    @property
+    def placeholder(self):
+        return f"/* {self.get_name()} */"
+
+    def iter_scripts(self):
+        """Yield the script of the places index, then of each marker with
+        its popup."""
+        coords_name = self.coords_subgroup.get_name()
+        place_name = self.place_subgroup.get_name()
+        icon_name = self.shared_icon.get_name()
+        places_name = f"{self.get_name()}_places"
+
+        # Index of each place, by place ID
+        places = {}
+        for tweet in self.geo_tweets:
+            if tweet.place and tweet.place.id not in places:
+                places[tweet.place.id] = (len(places), tweet.place)
+        place_tabs = display.render_places([place for _, place in places.values()])
+        yield self._places_template.render(
+            name=places_name,
+            places=to_script_json(
+                [
+                    {"loc": place.centroid, "tab": tab.replace("\n", " ")}
+                    for (_, place), tab in zip(places.values(), place_tabs)
+                ]
+            ),
+        )
+
+        # Popups are rendered in the order of the cells, for each cell to
+        # get all its popups in a row
+        cells = self.cells or [[i] for i in range(len(self.geo_tweets))]
+        popups = display.iter_popups(
+            [self.geo_tweets[i] for cell in cells for i in cell], self.jobs
+        )
+        lat = self.coords.lat.tolist()
+        lon = self.coords.lon.tolist()
+        has_coordinates = self.coords.has_coordinates.tolist()
+        wrapper = '<div style="width: 100.0%; height: 100.0%;">{}</div>'
+        for cell in cells:
+            pages = []
+            for i in cell:
+                tweet = self.geo_tweets[i]
+                popup_html = wrapper.format(next(popups)).replace("\n", " ")
+                # JSON strings, around the tab of the place from the index
+                parts = [
+                    to_script_json(part)
+                    for part in popup_html.split(display.PLACE_TAB_PLACEHOLDER)
+                ]
+                if tweet.place:
+                    place = "{}[{}]".format(places_name, places[tweet.place.id][0])
+                    pages.append(f" + {place}.tab + ".join(parts))
+                else:
+                    pages.append(parts[0])
+
+            # The marker of a cell is at the location of its first tweet
+            first = cell[0]
+            if has_coordinates[first]:
+                location = json.dumps([lat[first], lon[first]])
+            else:
+                place_id = self.geo_tweets[first].place.id
+                location = "{}[{}].loc".format(places_name, places[place_id][0])
+            group = coords_name if has_coordinates[first] else place_name
+            if len(pages) == 1:
+                yield self._marker_template.render(
+                    location=location, icon=icon_name, group=group, content=pages[0]
+                )
+            else:
+                yield self._cell_marker_template.render(
+                    location=location, icon=icon_name, group=group, pages=pages
+                )
+
+
+class LazyTweets(MacroElement):
+    """All tweets of the map as one compact JSON array.
+
+    Markers are created client-side and their popup is only built when
+    opened, see resources/js/lazy_popups.js. add_function is the browser
+    function adding the tweets to the map, called with the data, the layer
+    groups, the icon and extra_args (raw JS). When data_url is given, the
+    data is fetched from this URL instead of being inlined."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            {% if this.data_url %}
+            tweetsmapper.fetchTweets({{ this.data_url|tojson }}, {{ this.add_function }},
+            {% else %}
+            {{ this.add_function }}({{ this.data_json }},
+            {% endif %}
+                {{ this.coords_subgroup.get_name() }},
+                {{ this.place_subgroup.get_name() }},
+                {{ this.shared_icon.get_name() }}
+                {%- for arg in this.extra_args %},
+                {{ arg }}
+                {%- endfor %}
+            );
+        {% endmacro %}
+        """
+    )
+
+    def __init__(
+        self,
+        data,
+        coords_subgroup,
+        place_subgroup,
+        shared_icon,
+        add_function="tweetsmapper.addTweets",
+        data_url=None,
+        extra_args=(),
+    ):
+        super().__init__()
+        self._name = "LazyTweets"
+        self.data_json = to_script_json(data)
+        self.add_function = add_function
+        self.data_url = data_url
+        self.extra_args = extra_args
+        self.coords_subgroup = coords_subgroup
+        self.place_subgroup = place_subgroup
+        self.shared_icon = shared_icon
+
+
+def to_script_json(data):
+    """Serialize data to compact JSON that can be inlined in a <script>."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).replace(
+        "</", "<\\/"
+    )
+
+
+def script_element(js_file):
+    """Inline a JS file from the resources in a <script> element."""
+    with open(os.path.join(resources_path, "js", js_file)) as js:
+        return folium.Element("<script>{}</script>".format(js.read()))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Packed coordinates of tweets, as NumPy arrays
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+# lat and lon are NaN for tweets without a location
+Coordinates = namedtuple("Coordinates", ["lat", "lon", "has_coordinates"])
+
+
+def coordinates(tweets):
+    """Extract the location of tweets into arrays."""
+    # None becomes NaN
+    lat = np.array([t.lat for t in tweets], dtype=np.float64)
+    lon = np.array([t.lon for t in tweets], dtype=np.float64)
+    has_coordinates = np.array([t.has_coordinates for t in tweets], dtype=bool)
+    return Coordinates(lat, lon, has_coordinates)
+
+
+def aggregate(coords, precision):
+    """Group tweets of the same layer (coordinates or place only) whose
+    locations are equal once rounded to precision decimals.
+
+    Returns the indexes of the tweets of each group, groups being ordered
+    by their first tweet."""
+    lat = np.round(coords.lat, precision).tolist()
+    lon = np.round(coords.lon, precision).tolist()
+    cells = {}
+    for i, cell in enumerate(zip(coords.has_coordinates.tolist(), lat, lon)):
+        cells.setdefault(cell, []).append(i)
+    return list(cells.values())
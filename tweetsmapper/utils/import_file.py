@@ -25,57 +25,228 @@ File Imports
 import logging
 import os
 import json
-import tweepy
+import multiprocessing
+import re
 
-from tweetsmapper.utils import results, api
+from tweetsmapper.utils import compression, results, journal
+from tweetsmapper.utils.models import GeoTweet
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("tweetsmapper-fileinput")
 
+# Size of the byte ranges handed out to worker processes
+CHUNK_SIZE = 64 * 1024 * 1024
+# A place or coordinates member that is not null, whitespace allowed
+GEO_FIELD = re.compile(rb'"(?:place|coordinates)"\s*:(?!\s*null)')
 
-def process_tweets(input_file, config_file=None):
-    """Check file extension and process the file accordingly."""
 
-    suffix = os.path.splitext(input_file)[1].lower()[1:]
+def file_type(input_file):
+    """Return the type of a collection file, from its extension (before
+    the compression extension, if any)."""
+    return os.path.splitext(compression.strip_extension(input_file))[1].lower()[1:]
 
-    if suffix == "jsonl":
-        log.info(f"Reading tweets from {input_file}...")
-        log.debug("Processing JSONL file.")
-        geo_tweets = read_jsonl(input_file)
 
-    elif suffix == "txt":
-        log.info(f"Reading tweet IDs from {input_file}...")
-        keys = api.get_keys(config_file)
-        twitter_api = api.authenticate(keys)
-        geo_tweets = read_txt(input_file, twitter_api)
+def process_tweets(input_files, config_file=None, jobs=1, cache=None, resume=False):
+    """Read geo tweets from .jsonl files and tweet IDs from .txt files.
+
+    Files of each type are read as one collection, and tweets found in
+    several files (or several times in a file) are only kept once."""
+    jsonl_files = [f for f in input_files if file_type(f) == "jsonl"]
+    txt_files = [f for f in input_files if file_type(f) == "txt"]
+    seen_ids = set()
+    geo_tweets = []
+    duplicates = 0
+
+    if jsonl_files:
+        log.info(f"Reading tweets from {describe_files(jsonl_files)}...")
+        log.debug("Processing JSONL files.")
+        if jobs > 1:
+            tweets = read_jsonl_parallel(jsonl_files, jobs)
+        else:
+            tweets = read_jsonl(jsonl_files)
+        geo_tweets, duplicates = deduplicate(tweets, seen_ids)
+
+    if txt_files:
+        log.info(f"Reading tweet IDs from {describe_files(txt_files)}...")
+        from tweetsmapper.utils import api
+
+        twitter_apis = [
+            api.authenticate(keys) for keys in api.get_all_keys(config_file)
+        ]
+        journal_key = "|".join(os.path.abspath(f) for f in txt_files)
+        tweets = read_txt(
+            txt_files,
+            twitter_apis,
+            cache,
+            journal.Journal(f"hydrate:{journal_key}", resume),
+            skip_ids=seen_ids,
+        )
+        # IDs read from the .jsonl files are not hydrated again
+        geo_tweets.extend(tweets)
+
+    if duplicates:
+        log.info(f"Dropped {duplicates} duplicate geo tweets.")
     return geo_tweets
 
 
-def read_jsonl(input_file):
-    """Read tweets from a .jsonl file."""
+def describe_files(input_files):
+    if len(input_files) == 1:
+        return input_files[0]
+    return f"{len(input_files)} files"
+
+
+def collection_name(input_files, extension=True):
+    """Name a collection after its file, or after the directory holding
+    all its files."""
+    if len(input_files) == 1:
+        name = os.path.basename(input_files[0])
+        if not extension:
+            name = os.path.splitext(compression.strip_extension(name))[0]
+        return name
+    common_dir = os.path.commonpath([os.path.abspath(f) for f in input_files])
+    return os.path.basename(common_dir) or "tweets"
+
+
+def deduplicate(tweets, seen_ids):
+    """Keep the tweets whose ID is not in seen_ids yet, adding them to it.
+
+    Returns the tweets kept and the number of duplicates dropped. Only the
+    IDs of geo tweets are stored, as ints."""
+    unique, duplicates = [], 0
+    for tweet in tweets:
+        if tweet.id in seen_ids:
+            duplicates += 1
+        else:
+            seen_ids.add(tweet.id)
+            unique.append(tweet)
+    return unique, duplicates
+
+
+def has_geo_fields(line):
+    """Check if a raw JSON line has a non-null place or coordinates field.
+
+    Runs on bytes before any decoding: lines failing this check cannot
+    contain a geo tweet, the others are fully checked after parsing."""
+    return GEO_FIELD.search(line) is not None
+
+
+def parse_lines(lines):
+    """Parse raw JSON lines and yield geo tweets."""
+    users, places = {}, {}
+    for line in lines:
+        if not has_geo_fields(line):
+            continue
+        tweet_json = json.loads(line)
+        tweet = GeoTweet.from_json(tweet_json, users, places)
+        if results.is_geo(tweet):
+            yield tweet
+
+
+def read_lines(input_files):
+    """Yield the lines of files, one file after the other. Compressed files
+    are decompressed on the fly."""
+    for input_file in input_files:
+        if compression.compression(input_file):
+            yield from compression.read_lines(input_file)
+        else:
+            with open(input_file, "rb") as input:
+                yield from input
+
+
+def read_jsonl(input_files):
+    """Stream geo tweets from .jsonl files, one line at a time."""
+    return parse_lines(read_lines(input_files))
+
+
+def chunk_offsets(input_file, chunk_size=CHUNK_SIZE):
+    """Split a file into (start, end) byte ranges aligned on line boundaries."""
+    size = os.path.getsize(input_file)
+    offsets = []
+    with open(input_file, "rb") as input:
+        start = 0
+        while start < size:
+            input.seek(min(start + chunk_size, size))
+            input.readline()
+            end = min(input.tell(), size)
+            offsets.append((start, end))
+            start = end
+    return offsets
+
+
+def read_lines_range(input_file, start, end):
+    """Yield the lines of a file between two byte offsets."""
+    with open(input_file, "rb") as input:
+        input.seek(start)
+        position = start
+        while position < end:
+            line = input.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def read_jsonl_chunk(chunk):
+    """Worker: return the geo tweets of a byte range of a .jsonl file, or
+    of a whole compressed file if the range is None."""
+    input_file, start, end = chunk
+    if end is None:
+        return list(parse_lines(compression.read_lines(input_file)))
+    return list(parse_lines(read_lines_range(input_file, start, end)))
+
+
+def read_jsonl_parallel(input_files, jobs):
+    """Read geo tweets from .jsonl files with a pool of worker processes.
+
+    Chunks of all files are parsed in parallel and gathered back in input
+    order. Compressed files cannot be split, each of them is one chunk.
+    Users and places are then shared again across chunks."""
+    compressed = {f for f in input_files if compression.compression(f)}
+    total_size = sum(
+        os.path.getsize(input_file)
+        for input_file in input_files
+        if input_file not in compressed
+    )
+    chunk_size = min(CHUNK_SIZE, total_size // jobs + 1)
+    chunks = []
+    for input_file in input_files:
+        if input_file in compressed:
+            chunks.append((input_file, 0, None))
+        else:
+            chunks.extend(
+                (input_file, start, end)
+                for start, end in chunk_offsets(input_file, chunk_size)
+            )
+    log.debug(f"Reading {len(chunks)} chunks with {jobs} processes.")
+
     geo_tweets = []
-    with open(input_file) as input:
-        for line in input.readlines():
-            tweet_json = json.loads(line)
-            tweet = tweepy.models.Status().parse(tweepy.api, tweet_json)
-            if results.is_geo(tweet):
-                geo_tweets.append(tweet)
+    users, places = {}, {}
+    with multiprocessing.Pool(jobs) as pool:
+        for chunk_tweets in pool.imap(read_jsonl_chunk, chunks):
+            for tweet in chunk_tweets:
+                tweet.user = users.setdefault(tweet.user.id, tweet.user)
+                if tweet.place:
+                    tweet.place = places.setdefault(tweet.place.id, tweet.place)
+            geo_tweets.extend(chunk_tweets)
     return geo_tweets
 
 
-def read_txt(input_file, twitter_api):
-    """Read tweets ids from a .txt file and rehydrate them with the API."""
+def read_txt(input_files, twitter_apis, cache=None, journal=None, skip_ids=()):
+    """Read tweets ids from .txt files and rehydrate them with the API,
+    except those in skip_ids."""
+    from tweetsmapper.utils import api
+
     ids_list = []
-    with open(input_file) as input:
-        for line in input.readlines():
-            line = line.strip()
-            if line.isdigit():
-                id = line
-            else:
-                id = line.split(" ")[0]
+    for line in read_lines(input_files):
+        line = line.decode("utf-8").strip()
+        if line.isdigit():
+            id = line
+        else:
+            id = line.split(" ")[0]
+        if not id.isdigit() or int(id) not in skip_ids:
             ids_list.append(id)
 
-    tweets = api.hydrate(ids_list, twitter_api)
+    tweets = api.hydrate(ids_list, twitter_apis, cache, journal)
 
     geo_tweets = [t for t in tweets if results.is_geo(t)]
     # for t in tweets:
@@ -87,9 +258,6 @@ def read_txt(input_file, twitter_api):
 
 def has_unique_author(geo_tweets):
     "Check if all geo tweets are from the same user."
-    userid_list = []
-    for num, tweet in enumerate(geo_tweets):
-        if tweet.user.id not in userid_list:
-            userid_list.append(tweet.user.id)
+    userid_set = {tweet.user.id for tweet in geo_tweets}
 
-    return True if len(userid_list) == 1 else False
+    return True if len(userid_set) == 1 else False
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Progress journal of API downloads
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from tweetsmapper.utils import cache
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger("tweetsmapper-journal")
+
+
+def journal_path(key):
+    """Return the journal file path of a job, in the user cache directory."""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache.cache_dir(), "journals", f"{digest}.jsonl")
+
+
+class Journal:
+    """Append-only file of the batches of statuses already downloaded.
+
+    Each batch is one JSON line, synced to disk before the next batch is
+    fetched. A line torn by a crash is ignored. Unless resume is set, a
+    journal left by a previous run is discarded."""
+
+    def __init__(self, key, resume=False, path=None):
+        self.key = key
+        self.path = path or journal_path(key)
+        self.batches = self.read() if resume else []
+        if resume:
+            log.info(f"Resuming from {len(self.batches)} downloaded batches.")
+        elif os.path.exists(self.path):
+            log.debug(f"Discarding previous journal {self.path}")
+            os.remove(self.path)
+        self._file = None
+
+    def read(self):
+        """Return the batches committed to the journal."""
+        if not os.path.exists(self.path):
+            log.debug(f"No journal to resume from for {self.key}")
+            return []
+        batches = []
+        size = 0
+        with open(self.path, "rb") as journal_file:
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    log.debug("Ignoring torn batch at the end of the journal")
+                    # Drop it, so that the next batch starts on its own line
+                    os.truncate(self.path, size)
+                    break
+                batches.append(json.loads(line))
+                size += len(line)
+        return batches
+
+    def append(self, batch):
+        """Commit a batch to the journal."""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "ab")
+        self._file.write(json.dumps(batch, separators=(",", ":")).encode() + b"\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, done=True):
+        """Close the journal, and delete it once the job is done."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if done and os.path.exists(self.path):
+            os.remove(self.path)
+        elif not done:
+            log.info(
+                "Progress has been saved, run the same command with --resume "
+                "to continue."
+            )
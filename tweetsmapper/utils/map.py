@@ -24,16 +24,42 @@ Map Actions
 
 import logging
 import datetime
+import gzip
+import hashlib
 import os
 import folium
 from folium.plugins import MarkerCluster, FeatureGroupSubGroup
-import jinja2
-
-from tweetsmapper.utils import args_check, display, import_file, resources_path
+from branca.element import CssLink
+
+from tweetsmapper.utils import (
+    args_check,
+    cluster,
+    display,
+    elements,
+    geo,
+    import_file,
+    resources_path,
+)
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("tweetsmapper-map")
 
+# Split assets output layout
+STATIC_DIR = "static"
+DATA_FILE = "data.json.gz"
+
+# Browser functions adding the tweets data to the map, by render mode
+RENDER_FUNCTIONS = {
+    "markers": "tweetsmapper.addTweets",
+    "canvas": "tweetsmapper.addCanvasTweets",
+    "preclustered": "tweetsmapper.addPreclusteredTweets",
+}
+# Script needed by each render mode, on top of lazy_popups.js
+RENDER_SCRIPTS = {
+    "canvas": "canvas_layer.js",
+    "preclustered": "precluster_layer.js",
+}
+
 
 def create():
     """Create the base Leaftlet map."""
@@ -59,15 +85,25 @@ def create():
     return tweets_map
 
 
-def add_cluster(tweets_map):
-    """Create a Leaflet MarkerCluster to hold all geo tweets."""
-    with open(os.path.join(resources_path, "js", "create_cluster_icon.js")) as js_file:
-        create_cluster_icon = js_file.read()
+def create_cluster_icon(aggregate=False):
+    """Return the JS function creating the icon of a cluster.
+
+    With aggregate, clusters show the number of tweets of their markers rather
+    than the number of markers, at the cost of walking them on each refresh."""
+    if aggregate:
+        file_name = "create_aggregate_cluster_icon.js"
+    else:
+        file_name = "create_cluster_icon.js"
+    with open(os.path.join(resources_path, "js", file_name)) as js_file:
+        return js_file.read()
+
 
+def add_cluster(tweets_map, aggregate=False):
+    """Create a Leaflet MarkerCluster to hold all geo tweets."""
     log.debug("Creating MarkerCluster...")
     tweets_cluster = MarkerCluster(
         control=False,
-        icon_create_function=create_cluster_icon,
+        icon_create_function=create_cluster_icon(aggregate),
         options={
             "showCoverageOnHover": False,
             "spiderfyDistanceMultiplier": 1.7,
@@ -83,80 +119,95 @@ def add_cluster(tweets_map):
     return tweets_cluster
 
 
-def find_centroid(coordinates):
-    """Return the centroid of a bounding box."""
-    lon_list = [point[0] for point in coordinates[0]]
-    lat_list = [point[1] for point in coordinates[0]]
-    centroid = (
-        sum(lat_list) / float(len(lat_list)),
-        sum(lon_list) / float(len(lon_list)),
-    )
-    return centroid
-
-
-def add_marker(tweet, subgroup, popup_template):
-    """Create a marker representing a tweet."""
-    # Get coordinates
-    if tweet.coordinates:
-        lat, lon = (
-            tweet.coordinates["coordinates"][1],
-            tweet.coordinates["coordinates"][0],
-        )
-    else:
-        lat, lon = find_centroid(tweet.place.bounding_box.coordinates)
-
-    # Custom Icon
-    twitter_icon = folium.features.CustomIcon(
-        os.path.join(resources_path, "img", "marker.png"),
-        icon_size=(36, 45),
-        icon_anchor=(18, 45),
-        popup_anchor=(0, -38),
-    )
-    # Add marker
-    folium.Marker(
-        location=[lat, lon],
-        icon=twitter_icon,
-        popup=folium.Popup(
-            display.tweet_to_html(tweet, popup_template), parse_html=False
-        ),
-    ).add_to(subgroup)
-
-    log.debug(
-        "Added tweet {} to map. Place: {}, lat:{}, lon:{}".format(
-            tweet.id_str,
-            tweet.place.full_name if tweet.place else "None",
-            tweet.coordinates["coordinates"][1] if tweet.coordinates else None,
-            tweet.coordinates["coordinates"][0] if tweet.coordinates else None,
-        )
-    )
-
-
-def add_tweets(geo_tweets, cluster, tweets_map):
-    """Add all geo enabled tweets on the map."""
+def add_tweets(
+    geo_tweets,
+    tweets_cluster,
+    tweets_map,
+    lazy_popups=False,
+    data_url=None,
+    render="markers",
+    jobs=1,
+    aggregate=None,
+):
+    """Add all geo enabled tweets on the map.
+
+    With lazy_popups, tweets are embedded as compact data and popups are
+    built by the browser when a marker is clicked. With data_url, this data
+    is fetched from a separate file instead (see save_split). Other render
+    modes than markers do not use MarkerCluster: canvas draws tweets as
+    points on a canvas, preclustered shows the clusters computed by
+    cluster.precluster for the current zoom. Otherwise, markers and their
+    popups are only rendered when the map is written (see write_map), by a
+    pool of worker processes with several jobs. With markers, aggregate is
+    the precision (in decimals) at which co-located tweets share a single
+    marker, whose popup shows them one at a time."""
+
+    coords = geo.coordinates(geo_tweets)
 
     # Define subgroups for LayerControl
-    coords_count = sum(1 for t in geo_tweets if t.coordinates)
+    coords_count = int(coords.has_coordinates.sum())
     place_count = len(geo_tweets) - coords_count
-    coords_subgroup = FeatureGroupSubGroup(
-        cluster, f"Tweets with coordinates ({coords_count})"
-    )
-    place_subgroup = FeatureGroupSubGroup(
-        cluster, f"Tweets with place only ({place_count})"
-    )
-
-    # Load popup html template
+    coords_name = f"Tweets with coordinates ({coords_count})"
+    place_name = f"Tweets with place only ({place_count})"
+    if render == "markers":
+        coords_subgroup = FeatureGroupSubGroup(tweets_cluster, coords_name)
+        place_subgroup = FeatureGroupSubGroup(tweets_cluster, place_name)
+    else:
+        coords_subgroup = folium.FeatureGroup(coords_name)
+        place_subgroup = folium.FeatureGroup(place_name)
 
-    popup_template = display.get_template("popup.html.j2")
+    # Custom Icon, defined once for all markers
+    twitter_icon = elements.tweet_icon()
+    tweets_map.add_child(twitter_icon)
 
-    # Map tweets
-    for tweet in geo_tweets:
-        subgroup = coords_subgroup if tweet.coordinates else place_subgroup
+    if render == "markers" and aggregate is not None:
+        cells = geo.aggregate(coords, aggregate)
+        log.info(f"Aggregated {len(geo_tweets)} tweets into {len(cells)} markers.")
+    else:
+        cells = None
+
+    if lazy_popups or render != "markers":
+        data = display.tweets_to_data(geo_tweets, coords)
+        if cells:
+            data["cells"] = cells
+        extra_args = []
+        if render == "preclustered":
+            log.debug("Precomputing clusters...")
+            data["clusters"] = cluster.precluster(coords)
+            extra_args.append(create_cluster_icon())
+            tweets_map.get_root().header.add_child(
+                CssLink(dict(MarkerCluster.default_css)["markerclusterdefaultcss"])
+            )
 
-        add_marker(tweet=tweet, subgroup=subgroup, popup_template=popup_template)
+        for subgroup in [coords_subgroup, place_subgroup]:
+            tweets_map.add_child(subgroup)
+        tweets_map.add_child(
+            elements.LazyTweets(
+                data,
+                coords_subgroup,
+                place_subgroup,
+                twitter_icon,
+                RENDER_FUNCTIONS[render],
+                data_url=data_url,
+                extra_args=extra_args,
+            )
+        )
+        return
 
-    # Add subgroups to map
+    # Add subgroups to map, then their markers
     for subgroup in [coords_subgroup, place_subgroup]:
         tweets_map.add_child(subgroup)
+    tweets_map.add_child(
+        elements.StreamedMarkers(
+            geo_tweets,
+            coords,
+            coords_subgroup,
+            place_subgroup,
+            twitter_icon,
+            jobs=jobs,
+            cells=cells,
+        )
+    )
 
 
 def add_info(tweets_map, args, geo_tweets):
@@ -171,7 +222,7 @@ def add_info(tweets_map, args, geo_tweets):
         title = "@" + geo_tweets[0].user.screen_name
         emoji = "user"
     else:
-        title = os.path.basename(args.input_file)
+        title = import_file.collection_name(args.input_files)
         emoji = "file"
 
     legend_html = display.create_legend(title, emoji)
@@ -196,27 +247,114 @@ def customize(tweets_map, args, geo_tweets):
     # Adding legend info to map
     tweets_map = add_info(tweets_map, args, geo_tweets)
 
-    # Additional CSS
+    # Additional CSS & JS
+    header = tweets_map.get_root().header
+    if args.split_assets:
+        log.debug("Linking static bundles...")
+        for bundle in static_bundles():
+            if bundle.endswith(".css"):
+                element = f'<link rel="stylesheet" href="{STATIC_DIR}/{bundle}"/>'
+            else:
+                element = f'<script src="{STATIC_DIR}/{bundle}"></script>'
+            header.add_child(folium.Element(element))
+        return tweets_map
+
     log.debug("Including additional CSS...")
     css_dir = os.path.join(resources_path, "css")
     for css_file_path in [x for x in os.listdir(css_dir)]:
         with open(os.path.join(css_dir, css_file_path)) as css_file:
             css = css_file.read()
-            tweets_map.get_root().header.add_child(
-                folium.Element(f"<style>{css}</style>")
-            )
+            header.add_child(folium.Element(f"<style>{css}</style>"))
+
+    if args.lazy_popups:
+        header.add_child(elements.script_element("lazy_popups.js"))
+    # Canvas and preclustered popups also page through the tweets of a spot
+    if args.aggregate is not None or args.render in RENDER_SCRIPTS:
+        header.add_child(elements.script_element("paged_popups.js"))
+    if args.render in RENDER_SCRIPTS:
+        header.add_child(elements.script_element(RENDER_SCRIPTS[args.render]))
 
     return tweets_map
 
 
+def static_bundles():
+    """Return the CSS and JS bundles of split assets maps, by file name.
+
+    File names include a hash of their content so that browsers can cache
+    them for as long as they do not change."""
+    bundles = {}
+    for extension, folder, files in [
+        ("css", "css", sorted(os.listdir(os.path.join(resources_path, "css")))),
+        (
+            "js",
+            "js",
+            ["lazy_popups.js", "paged_popups.js"] + sorted(RENDER_SCRIPTS.values()),
+        ),
+    ]:
+        contents = []
+        for file_name in files:
+            with open(
+                os.path.join(resources_path, folder, file_name), encoding="utf-8"
+            ) as f:
+                contents.append(f.read())
+        content = "\n".join(contents)
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()[:10]
+        bundles[f"tweetsmapper.{digest}.{extension}"] = content
+    return bundles
+
+
+def save_split(tweets_map, output_dir):
+    """Save the map as a directory: HTML shell, static bundles and data.
+
+    Static bundles are only written when missing, so regenerating a map
+    in the same directory only rewrites the HTML shell and the data."""
+    static_dir = os.path.join(output_dir, STATIC_DIR)
+    os.makedirs(static_dir, exist_ok=True)
+
+    for bundle, content in static_bundles().items():
+        bundle_path = os.path.join(static_dir, bundle)
+        if not os.path.exists(bundle_path):
+            log.debug(f"Writing static bundle {bundle_path}...")
+            with open(bundle_path, "w", encoding="utf-8") as bundle_file:
+                bundle_file.write(content)
+
+    for element in tweets_map._children.values():
+        if isinstance(element, elements.LazyTweets):
+            log.debug("Writing tweets data...")
+            with gzip.open(
+                os.path.join(output_dir, DATA_FILE), "wt", encoding="utf-8"
+            ) as data_file:
+                data_file.write(element.data_json)
+
+    write_map(tweets_map, os.path.join(output_dir, "index.html"))
+
+
+def write_map(tweets_map, output_path):
+    """Write the map HTML file, streaming the script of its markers."""
+    html = tweets_map.get_root().render()
+    streamed = [
+        element
+        for element in tweets_map._children.values()
+        if isinstance(element, elements.StreamedMarkers)
+    ]
+
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        for element in streamed:
+            head, html = html.split(element.placeholder, 1)
+            output_file.write(head)
+            for script in element.iter_scripts():
+                output_file.write(script)
+        output_file.write(html)
+
+
 def save(tweets_map, args):
-    """Save the Leaflet map as an HTML file."""
+    """Save the Leaflet map as an HTML file, and return its path."""
 
     # Define base filename
     if args_check.input_source(args) == "user":
         title = args.screen_name
     elif args_check.input_source(args) == "file":
-        title = os.path.splitext(os.path.basename(args.input_file))[0]
+        title = import_file.collection_name(args.input_files, extension=False)
 
     default_filename = "{}-{}.html".format(
         title, datetime.datetime.utcnow().strftime("%Y%m%d-%H%M")
@@ -231,7 +369,14 @@ def save(tweets_map, args):
     else:
         output_path = default_filename
 
+    if args.split_assets:
+        output_path = os.path.splitext(output_path)[0]
+
     abs_output_path = os.path.abspath(output_path)
     log.debug(f"Trying to save map to {abs_output_path}...")
-    tweets_map.save(output_path)
+    if args.split_assets:
+        save_split(tweets_map, output_path)
+    else:
+        write_map(tweets_map, output_path)
     log.info(f"Map saved to {abs_output_path}")
+    return abs_output_path
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compact tweet records
+"""
+
+import datetime
+from collections import namedtuple
+
+TWITTER_DATE_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+
+# Entities of the tweet text, sorted by position (None if the tweet JSON
+# has no entities). kind is one of "hashtag", "mention", "url", "media".
+Entity = namedtuple("Entity", ["start", "end", "kind", "value", "display"])
+
+# First media of a tweet, with the total number of media attached.
+Media = namedtuple("Media", ["url", "type", "total"])
+
+
+def find_centroid(coordinates):
+    """Return the centroid of a bounding box."""
+    lon_list = [point[0] for point in coordinates[0]]
+    lat_list = [point[1] for point in coordinates[0]]
+    centroid = (
+        sum(lat_list) / float(len(lat_list)),
+        sum(lon_list) / float(len(lon_list)),
+    )
+    return centroid
+
+
+class User:
+    """Author of a tweet, limited to the fields displayed on the map."""
+
+    __slots__ = ("id", "screen_name", "name", "profile_image_url_https", "verified")
+
+    def __init__(self, id, screen_name, name, profile_image_url_https, verified):
+        self.id = id
+        self.screen_name = screen_name
+        self.name = name
+        self.profile_image_url_https = profile_image_url_https
+        self.verified = verified
+
+    @classmethod
+    def from_json(cls, user_json):
+        return cls(
+            user_json["id"],
+            user_json["screen_name"],
+            user_json.get("name", ""),
+            user_json.get("profile_image_url_https", ""),
+            user_json.get("verified", False),
+        )
+
+
+class Place:
+    """Twitter place, with the centroid of its bounding box."""
+
+    __slots__ = ("id", "full_name", "place_type", "country", "country_code", "centroid")
+
+    def __init__(self, id, full_name, place_type, country, country_code, centroid):
+        self.id = id
+        self.full_name = full_name
+        self.place_type = place_type
+        self.country = country
+        self.country_code = country_code
+        self.centroid = centroid
+
+    @classmethod
+    def from_json(cls, place_json):
+        bounding_box = place_json.get("bounding_box")
+        if bounding_box and bounding_box.get("coordinates"):
+            centroid = find_centroid(bounding_box["coordinates"])
+        else:
+            centroid = None
+        return cls(
+            place_json["id"],
+            place_json.get("full_name", ""),
+            place_json.get("place_type"),
+            place_json.get("country", ""),
+            place_json.get("country_code", ""),
+            centroid,
+        )
+
+
+def compact_entities(entities_json):
+    """Keep only the text entities needed to render a tweet."""
+    entities = []
+    for hashtag in entities_json.get("hashtags", []):
+        start, end = hashtag["indices"]
+        entities.append(Entity(start, end, "hashtag", hashtag["text"], None))
+    for mention in entities_json.get("user_mentions", []):
+        start, end = mention["indices"]
+        entities.append(Entity(start, end, "mention", mention["screen_name"], None))
+    for kind in ("urls", "media"):
+        for url in entities_json.get(kind, []):
+            start, end = url["indices"]
+            entities.append(
+                Entity(
+                    start,
+                    end,
+                    "url" if kind == "urls" else "media",
+                    url.get("expanded_url") or url["url"],
+                    url.get("display_url") or url["url"],
+                )
+            )
+    entities.sort()
+    return tuple(entities)
+
+
+def first_media(tweet_json):
+    """Return the first media of a tweet, if any."""
+    media = tweet_json.get("entities", {}).get("media")
+    if not media:
+        return None
+    extended_media = tweet_json.get("extended_entities", {}).get("media") or media
+    return Media(
+        media[0]["media_url_https"], extended_media[0]["type"], len(extended_media)
+    )
+
+
+class GeoTweet:
+    """Compact record of a tweet, holding only what the map needs.
+
+    lat and lon are the exact coordinates of the tweet when it has some,
+    or the centroid of its place otherwise. Users and places are shared
+    between records built with the same users and places dicts."""
+
+    __slots__ = (
+        "id",
+        "full_text",
+        "created_at",
+        "favorite_count",
+        "entities",
+        "media",
+        "user",
+        "place",
+        "lat",
+        "lon",
+        "has_coordinates",
+    )
+
+    def __init__(
+        self,
+        id,
+        full_text,
+        created_at,
+        favorite_count,
+        entities,
+        media,
+        user,
+        place,
+        lat,
+        lon,
+        has_coordinates,
+    ):
+        self.id = id
+        self.full_text = full_text
+        self.created_at = created_at
+        self.favorite_count = favorite_count
+        self.entities = entities
+        self.media = media
+        self.user = user
+        self.place = place
+        self.lat = lat
+        self.lon = lon
+        self.has_coordinates = has_coordinates
+
+    @property
+    def id_str(self):
+        return str(self.id)
+
+    @classmethod
+    def from_json(cls, tweet_json, users=None, places=None):
+        """Build a record from a tweet JSON payload (API or JSONL file)."""
+        users = {} if users is None else users
+        places = {} if places is None else places
+
+        user_json = tweet_json["user"]
+        user = users.get(user_json["id"])
+        if user is None:
+            user = users[user_json["id"]] = User.from_json(user_json)
+
+        place_json = tweet_json.get("place")
+        if place_json:
+            place = places.get(place_json["id"])
+            if place is None:
+                place = places[place_json["id"]] = Place.from_json(place_json)
+        else:
+            place = None
+
+        coordinates = tweet_json.get("coordinates")
+        if coordinates:
+            lon, lat = coordinates["coordinates"][:2]
+            has_coordinates = True
+        elif place and place.centroid:
+            lat, lon = place.centroid
+            has_coordinates = False
+        else:
+            lat = lon = None
+            has_coordinates = False
+
+        return cls(
+            tweet_json["id"],
+            tweet_json.get("full_text") or tweet_json.get("text", ""),
+            datetime.datetime.strptime(tweet_json["created_at"], TWITTER_DATE_FORMAT),
+            tweet_json.get("favorite_count", 0),
+            compact_entities(tweet_json["entities"])
+            if "entities" in tweet_json
+            else None,
+            first_media(tweet_json),
+            user,
+            place,
+            lat,
+            lon,
+            has_coordinates,
+        )
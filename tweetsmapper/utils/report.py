@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# tweetsmapper
+# Copyright (C) 2019 r3mlab
+# https://github.com/r3mlab/tweetsmapper
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Run report: time and memory spent in each stage
+"""
+
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from tweetsmapper import __version__
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger("tweetsmapper-report")
+
+
+def rss_mb():
+    """Return the current resident memory of the process in MB, or None
+    where it cannot be read (only on Linux)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def cumulative_peak_rss_mb(who="self"):
+    """Return the peak resident memory of the process (or of its finished
+    children) since it started, in MB."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN
+    )
+    # Kilobytes on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / unit, 1)
+
+
+class RunReport:
+    """Wall and CPU time, memory and counters of each stage of a run.
+
+    Memory is sampled when each stage starts and ends. The peak memory of
+    the process is only known since it started: the cumulative peak after
+    a stage is an upper bound of the peak of this stage.
+
+    When disabled, stages and counters are not recorded. With cprofile_stage,
+    this stage also runs under cProfile and its stats are kept to be dumped
+    next to the report."""
+
+    def __init__(self, enabled=False, cprofile_stage=None):
+        self.enabled = enabled
+        self.cprofile_stage = cprofile_stage
+        self.profiler = None
+        self.stages = []
+        self.counters = {}
+        self.started = time.perf_counter(), time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Record the stage run within this context."""
+        if not self.enabled:
+            yield
+            return
+
+        if name == self.cprofile_stage:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        rss_start = rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if name == self.cprofile_stage:
+                self.profiler.disable()
+            self.stages.append(
+                {
+                    "name": name,
+                    "wall_seconds": round(wall, 4),
+                    "cpu_seconds": round(cpu, 4),
+                    "rss_start_mb": rss_start,
+                    "rss_end_mb": rss_mb(),
+                    "cumulative_peak_rss_mb": cumulative_peak_rss_mb(),
+                    "children_cumulative_peak_rss_mb": cumulative_peak_rss_mb(
+                        "children"
+                    ),
+                }
+            )
+            log.debug(f"Stage {name}: {wall:.3f} s wall, {cpu:.3f} s CPU")
+
+    def count(self, name, value):
+        if self.enabled:
+            self.counters[name] = value
+
+    def to_dict(self):
+        return {
+            "version": __version__,
+            "date": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "argv": sys.argv[1:],
+            "wall_seconds": round(time.perf_counter() - self.started[0], 4),
+            "cpu_seconds": round(time.process_time() - self.started[1], 4),
+            "cumulative_peak_rss_mb": cumulative_peak_rss_mb(),
+            "children_cumulative_peak_rss_mb": cumulative_peak_rss_mb("children"),
+            "stages": self.stages,
+            "counters": self.counters,
+        }
+
+    def save(self, report_path):
+        """Write the JSON report, and the cProfile stats if any."""
+        if not self.enabled:
+            return
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+        log.info(f"Run report saved to {os.path.abspath(report_path)}")
+
+        if self.profiler:
+            stats_path = (
+                os.path.splitext(report_path)[0] + f".{self.cprofile_stage}.prof"
+            )
+            self.profiler.dump_stats(stats_path)
+            log.info(f"Profile of stage {self.cprofile_stage} saved to {stats_path}")
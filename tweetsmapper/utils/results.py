@@ -31,13 +31,9 @@ log = logging.getLogger("tweetsmapper-results")
 def is_geo(tweet):
     """Filter geo-enabled tweets."""
     if tweet.place:
-        return True
-    elif tweet.coordinates:
-        lat, lon = (
-            tweet.coordinates["coordinates"][1],
-            tweet.coordinates["coordinates"][0],
-        )
-        if lat == 0 and lon == 0:
+        return tweet.lat is not None
+    elif tweet.has_coordinates:
+        if tweet.lat == 0 and tweet.lon == 0:
             log.debug(
                 "Tweet ID {} has lat: 0 & lon: 0. Filtering it out.".format(
                     tweet.id_str
@@ -57,7 +53,7 @@ def check(geo_tweets):
         log.error("Could not find tweets with geo information for this user.")
         raise SystemExit(1)
     else:
-        tweets_w_coordinates_count = sum(1 for t in geo_tweets if t.coordinates)
+        tweets_w_coordinates_count = sum(1 for t in geo_tweets if t.has_coordinates)
         log.info(
             "Found {} geo enabled tweets, including {} with coordinates.".format(
                 len(geo_tweets), tweets_w_coordinates_count